@@ -1,7 +1,8 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+from typing import Optional
 from arcadepy import Arcade
 from dotenv import load_dotenv
 import uvicorn
@@ -9,11 +10,26 @@ import os
 import uuid
 
 from factory.builder import WorkflowConfig
+from factory.llm import get_llm_limiter, model_concurrency_stats
+from factory.llm_cache import get_completion_cache
+from factory.rate_limit import get_rate_limiter
+from factory.result_store import WorkflowRecord, get_result_store
 from factory.runner import WorkflowRunner
+from factory.scheduler import WorkflowScheduler
+from factory.tool_idempotency import get_idempotency_store
+from factory.tool_pool import get_tool_pool, shutdown_tool_pool
+from factory.tools import close_tool_executor
+from factory.workflow_cache import get_workflow_cache
+from factory.trace_writer import peek_trace_writer, shutdown_trace_writer
+from factory.trace_stream import init_tracing, tracing_stats
+from factory.webhooks import get_webhook_dispatcher
+from factory.workflow_events import WORKFLOW_STREAM_HEARTBEAT_SECONDS, format_sse
 
 # Authentication configuration
 load_dotenv()
 BEARER_TOKEN = os.getenv("FACTORY_BEARER_TOKEN", "bearer-token-2024")
+# Longest a /workflow/result long-poll is held
+WORKFLOW_RESULT_MAX_WAIT_SECONDS = float(os.getenv("WORKFLOW_RESULT_MAX_WAIT_SECONDS", "60"))
 
 # FastAPI app
 app = FastAPI(
@@ -24,13 +40,34 @@ app = FastAPI(
 # Security scheme
 security = HTTPBearer()
 
-# Track running workflows
-running_workflows = {}
+# Running workflows and finished results (bounded, with TTL)
+results = get_result_store()
+
+# Bounded pool of async workers that executes workflows
+scheduler = WorkflowScheduler()
+
+@app.on_event("startup")
+async def start_scheduler():
+    # Shared tracing processor and Firestore client, created once per process
+    init_tracing()
+    scheduler.start()
+    get_webhook_dispatcher().start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    # Deliver (or dead-letter) completion webhooks, including those of workflows cancelled above
+    await get_webhook_dispatcher().stop()
+    shutdown_tool_pool()
+    await close_tool_executor()
+    # Flush buffered trace writes before the process exits
+    shutdown_trace_writer()
 
 class RunWorkflowRequest(BaseModel):
     workflow_config: WorkflowConfig
     user_id: str
     user_task: str
+    callback_url: Optional[str] = None  # POSTed the result when the workflow finishes
 
 class RunWorkflowResponse(BaseModel):
     success: bool
@@ -58,39 +95,95 @@ async def verify_workflow(workflow_config: WorkflowConfig, token: str = Depends(
 @app.post("/run/workflow/local", response_model=RunWorkflowResponse)
 async def run_workflow(run_workflow_request: RunWorkflowRequest, token: str = Depends(verify_token)):
     """Deploy a workflow with the specified settings"""
-    global running_workflows
     trace_id = str(uuid.uuid4())
+    if run_workflow_request.callback_url:
+        try:
+            await get_webhook_dispatcher().check_url(run_workflow_request.callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except OSError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"callback_url host cannot be resolved: {e}")
 
     runner = WorkflowRunner(
         workflow_config=run_workflow_request.workflow_config,
         user_id=run_workflow_request.user_id,
         user_task=run_workflow_request.user_task,
-        trace_id=trace_id
+        trace_id=trace_id,
+        callback_url=run_workflow_request.callback_url,
     )
-    runner.start()
-    running_workflows[trace_id] = runner
+    results.add(runner)
+    if not scheduler.submit(runner):
+        results.discard(trace_id)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Workflow queue is full, retry later",
+            headers={"Retry-After": str(scheduler.retry_after())},
+        )
 
     return JSONResponse(content={"success": True, "trace_id": trace_id})
 
+@app.get("/workflow/status")
+async def get_scheduler_status():
+    """Get queue depth, wait time and worker utilization of the scheduler"""
+    return JSONResponse(content={"success": True, "scheduler": scheduler.snapshot()})
+
 @app.get("/workflow/status/{trace_id}")
 async def get_workflow_status(trace_id: str):
     """Get the status of a workflow"""
-    if trace_id not in running_workflows:
+    entry = results.get(trace_id)
+    if entry is None:
+        return JSONResponse(content={"success": False, "trace_id": trace_id, "status": "not_found"})
+    return JSONResponse(content={
+        "success": True,
+        "trace_id": trace_id,
+        "status": entry.status,
+        "queue_wait_ms": entry.queue_wait_ms,
+        "run_ms": entry.run_ms,
+        "stats": entry.stats,
+        "timings_ms": entry.timings_ms,
+        "scheduler": scheduler.snapshot(),
+    })
+
+@app.get("/workflow/stream/{trace_id}")
+async def stream_workflow(trace_id: str, last_event_id: str = Header(None), token: str = Depends(verify_token)):
+    """Stream workflow progress (agents, tools, LLM tokens) as Server-Sent Events"""
+    entry = results.get(trace_id)
+    if entry is None:
         return JSONResponse(content={"success": False, "trace_id": trace_id, "status": "not_found"})
-    return JSONResponse(content={"success": True, "trace_id": trace_id, "status": running_workflows[trace_id].status})
+    events = entry.event_log() if isinstance(entry, WorkflowRecord) else entry.events
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def event_stream():
+        async for event in events.subscribe(after, heartbeat_s=WORKFLOW_STREAM_HEARTBEAT_SECONDS):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/workflow/result/{trace_id}")
-async def get_workflow_result(trace_id: str):
-    """Get the result of a workflow"""
+async def get_workflow_result(trace_id: str, wait: float = 0):
+    """
+    Get the result of a workflow
+
+    With `wait` (seconds, capped at WORKFLOW_RESULT_MAX_WAIT_SECONDS) the request is
+    held until the workflow finishes or the timeout expires, instead of polling.
+    """
 
-    if trace_id not in running_workflows:
+    entry = results.get(trace_id)
+    if entry is None:
         return JSONResponse(content={"success": False, "trace_id": trace_id, "status": "not_found"})
-    
-    if running_workflows[trace_id].status in ['pending', 'running']:
+
+    if wait > 0:
+        await entry.wait(min(wait, WORKFLOW_RESULT_MAX_WAIT_SECONDS))
+
+    if entry.status in ['pending', 'running']:
         return JSONResponse(content={"success": False, "trace_id": trace_id, "status": "not_completed"})
 
-    result = running_workflows[trace_id].result
-    del running_workflows[trace_id]
+    # Reads are idempotent: the result stays available (and retries succeed) until it expires
+    result = entry.result
 
     return JSONResponse(content={"success": True, "trace_id": trace_id, "result": result})
 
@@ -99,6 +192,23 @@ async def health_check():
     """Health check endpoint - no authentication required"""
     return JSONResponse(content={"status": "healthy", "service": "coral-factory-api"})
 
+@app.get("/metrics")
+async def metrics(token: str = Depends(verify_token)):
+    """Runtime metrics for capacity tuning"""
+    return JSONResponse(content={
+        "llm": get_llm_limiter().snapshot(),
+        "llm_models": model_concurrency_stats(),
+        "llm_cache": get_completion_cache().stats(),
+        "rate_limits": get_rate_limiter().snapshot(),
+        "workflow_cache": get_workflow_cache().stats(),
+        "tools": get_tool_pool().stats(),
+        "tool_idempotency": get_idempotency_store().stats() if get_idempotency_store() else None,
+        "webhooks": get_webhook_dispatcher().stats(),
+        "result_store": results.stats(),
+        "tracing": tracing_stats(),
+        "trace_writer": peek_trace_writer().stats() if peek_trace_writer() else None,
+    })
+
 @app.get("/auth/status")
 async def auth_status(token: str = Depends(verify_token)):
     """Check authentication status"""
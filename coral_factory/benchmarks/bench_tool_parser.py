@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for ToolCommandParser on large agent outputs
+Compares the single-pass scanner with the previous three-pass regex + str.replace approach
+
+Usage (from coral_factory/):
+    python -m benchmarks.bench_tool_parser [--kb 100 200 500] [--commands 50] [--repeat 5]
+"""
+
+import argparse
+import logging
+import re
+import time
+
+from factory.tool_parser import ToolCommandParser
+
+
+class _NullExecutor:
+    """Returns canned results so only parsing and rewriting is measured"""
+
+    def send_email(self, to, subject, body):
+        return f"[email sent to {to}]"
+
+    def create_calendar_event(self, title, date, time):
+        return f"[event {title} on {date} {time}]"
+
+    def post_tweet(self, text):
+        return f"[tweet {text[:20]}]"
+
+
+# Previous implementation, kept here as the baseline
+_LEGACY_PATTERNS = (
+    (r'SEND_EMAIL:\s*to=([^|]+)\|\s*subject=([^|]+)\|\s*body=(.+?)(?=\n[A-Z_]+:|$)', "send_email"),
+    (r'CREATE_EVENT:\s*title=([^|]+)\|\s*date=([^|]+)\|\s*time=([^|]+)', "create_calendar_event"),
+    (r'POST_TWEET:\s*text=(.+?)(?=\n[A-Z_]+:|$)', "post_tweet"),
+)
+
+
+def legacy_parse_and_execute(executor, agent_output):
+    tool_results = []
+    modified_output = agent_output
+    for pattern, tool in _LEGACY_PATTERNS:
+        for match in re.finditer(pattern, agent_output, re.DOTALL):
+            args = [group.strip() for group in match.groups()]
+            result = getattr(executor, tool)(*args)
+            tool_results.append(result)
+            modified_output = modified_output.replace(match.group(0), result)
+    return modified_output, tool_results
+
+
+def build_output(size_kb: int, commands: int) -> str:
+    """Prose with commands spread evenly through it, roughly size_kb kilobytes"""
+    filler = "The quarterly numbers look steady and the team is on track for the launch.\n"
+    templates = (
+        "SEND_EMAIL: to=user{i}@example.com | subject=Report {i} | body=Numbers for batch {i} are attached.\n",
+        "CREATE_EVENT: title=Review {i} | date=2025-10-10 | time=14:00 |\n",
+        "POST_TWEET: text=Update {i}: shipping soon #AI\n",
+    )
+    target = size_kb * 1024
+    paragraph = filler * max(1, target // (len(filler) * max(commands, 1)))
+    parts = []
+    for i in range(commands):
+        parts.append(paragraph)
+        parts.append(templates[i % len(templates)].format(i=i))
+    parts.append(paragraph)
+    return "".join(parts)
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kb", type=int, nargs="+", default=[100, 200, 500])
+    parser.add_argument("--commands", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Keep the per-command info logs out of the timings
+    logging.disable(logging.INFO)
+    executor = _NullExecutor()
+    tool_parser = ToolCommandParser(executor)
+
+    print(f"{'size':>8} {'commands':>9} {'legacy ms':>10} {'scanner ms':>11} {'speedup':>8}")
+    for size_kb in args.kb:
+        output = build_output(size_kb, args.commands)
+        legacy_ms = timed(lambda: legacy_parse_and_execute(executor, output), args.repeat)
+        scanner_ms = timed(lambda: tool_parser.parse_and_execute(output), args.repeat)
+        print(f"{len(output) // 1024:>6}KB {args.commands:>9} {legacy_ms:>10.2f} {scanner_ms:>11.2f} {legacy_ms / scanner_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
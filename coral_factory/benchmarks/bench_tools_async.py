@@ -0,0 +1,102 @@
+"""
+Load test for ToolExecutor.execute_tool_async against the local stand-in server
+Compares pooled keep-alive connections with a new connection per call
+
+Usage (from coral_factory/):
+    python -m benchmarks.bench_tools_async [--calls 500] [--concurrency 50] [--latency-ms 20]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    return parser.parse_args()
+
+
+async def run_calls(executor, calls: int, concurrency: int) -> float:
+    """Fire calls across the three tools with at most `concurrency` in flight; returns seconds"""
+    semaphore = asyncio.Semaphore(concurrency)
+    requests = [
+        ("send_email", {"to": "user@example.com", "subject": "Load test", "body": "Hello"}),
+        ("create_calendar_event", {"title": "Load test", "date": "2025-10-10", "time": "14:00"}),
+        ("post_tweet", {"text": "Load test #AI"}),
+    ]
+
+    async def one(i: int) -> str:
+        tool, params = requests[i % len(requests)]
+        async with semaphore:
+            return await executor.execute_tool_async(tool, params)
+
+    # Warm up imports and the first connection outside the timed window
+    for tool, params in requests:
+        await executor.execute_tool_async(tool, params)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    failures = [result for result in results if result.startswith("❌")]
+    if failures:
+        raise RuntimeError(f"{len(failures)} calls failed, first: {failures[0]}")
+    await executor.aclose()
+    return elapsed
+
+
+def start_server_process(latency_ms: float):
+    """Run the stand-in in its own process so it does not share the benchmark's GIL"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.tool_standin_server", "--port", str(port), "--latency-ms", str(latency_ms)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Stand-in server did not start")
+
+
+def main():
+    args = parse_args()
+    server, base_url = start_server_process(args.latency_ms)
+
+    # Point the executor at the stand-in before its module reads the environment
+    os.environ.update({
+        "TOOL_TEST_MODE": "true",
+        "GMAIL_API_URL": base_url,
+        "CALENDAR_API_URL": base_url,
+        "TWITTER_API_URL": base_url,
+    })
+    logging.disable(logging.INFO)
+    from factory import tools
+
+    print(f"{args.calls} calls, {args.concurrency} concurrent, {args.latency_ms}ms server latency, "
+          f"pool of {tools.TOOL_HTTP_MAX_CONNECTIONS} connections per service")
+    for label, keepalive in (("pooled keep-alive", tools.TOOL_HTTP_MAX_KEEPALIVE), ("new connection per call", 0)):
+        tools.TOOL_HTTP_MAX_KEEPALIVE = keepalive
+        executor = tools.ToolExecutor(test_mode=True)
+        executor.initialize()
+        elapsed = asyncio.run(run_calls(executor, args.calls, args.concurrency))
+        print(f"  {label:<24} {elapsed * 1000:8.1f} ms  {args.calls / elapsed:8.1f} calls/s")
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
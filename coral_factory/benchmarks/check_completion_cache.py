@@ -0,0 +1,86 @@
+"""
+Check that re-running a workflow with the same config and task hits the LLM completion cache
+The provider call is replaced by a counter, so no API key or network is needed
+
+Usage (from coral_factory/):
+    python -m benchmarks.check_completion_cache [--gap 1.5]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import litellm
+
+from factory.workflow_cache import compile_workflow
+from factory.workflow_context import WorkflowContext, current_workflow
+
+
+def _config():
+    agent = SimpleNamespace(
+        name="Analyst",
+        persona="market analyst who summarises company news",
+        output="A short summary",
+        guidelines=["Be concise"],
+        toolkits=[],
+    )
+    return SimpleNamespace(agents=[agent], model_name="gemini-2.5-flash", relations_type="single")
+
+
+async def _run_once(compiled, user_task: str, calls: list, user_id: str = "check") -> dict:
+    """One workflow run as builder() does it with cache_completions on: fresh agents, date-only time context"""
+    context = WorkflowContext(trace_id=f"check-{len(calls)}", user_id=user_id, cache_completions=True)
+    token = current_workflow.set(context)
+    try:
+        agents = compiled.instantiate(api_key="unused", user_id=user_id, date_only=True)
+        for agent in agents.values():
+            await agent.run(user_task)
+    finally:
+        current_workflow.reset(token)
+    return context.stats.get("llm_cache", {})
+
+
+async def main_async(gap_s: float) -> bool:
+    calls = []
+
+    async def counting_completion(**request):
+        calls.append(request)
+        message = SimpleNamespace(content=f"answer #{len(calls)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    litellm.acompletion = counting_completion
+    compiled = compile_workflow(_config(), key="check")
+    user_task = "Summarise today's news about ACME Corp"
+
+    first = await _run_once(compiled, user_task, calls)
+    # Cross at least one second boundary: a full timestamp would differ, the date-only context does not
+    time.sleep(gap_s)
+    second = await _run_once(compiled, user_task, calls)
+    # Same prompt from another user must not be served someone else's completion
+    other_user = await _run_once(compiled, user_task, calls, user_id="someone-else")
+
+    print(f"first run:  {first}")
+    print(f"second run: {second}")
+    print(f"other user: {other_user}")
+    print(f"provider calls: {len(calls)}")
+    return (
+        second.get("hits", 0) > 0 and second.get("misses", 0) == 0
+        and other_user.get("misses", 0) == 1 and len(calls) == 2
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check completion cache hits across workflow runs")
+    parser.add_argument("--gap", type=float, default=1.5, help="Seconds between the two runs")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    ok = asyncio.run(main_async(args.gap))
+    print("✅ second run served from the cache" if ok else "❌ second run missed the cache")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Local stand-in for the Gmail, Calendar and X endpoints used by the tool executor
+Answers with canned JSON after a configurable latency, so tool throughput can be
+load-tested without real accounts
+
+Usage (from coral_factory/):
+    python -m benchmarks.tool_standin_server --port 8765 --latency-ms 50
+
+then run the app or a benchmark with:
+    TOOL_TEST_MODE=true GMAIL_API_URL=http://127.0.0.1:8765 \
+    CALENDAR_API_URL=http://127.0.0.1:8765 TWITTER_API_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so connection pooling on the client side is measurable
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; avoid Nagle/delayed-ACK stalls
+    disable_nagle_algorithm = True
+    latency_s = 0.05
+    _ids = itertools.count(1)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = self.rfile.read(length)
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+        if self.path.startswith("/batch/"):
+            status, content_type, data = self.route_batch(payload)
+        else:
+            status, body = self.route(self.path, payload)
+            content_type, data = "application/json", json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self, path: str, payload: bytes) -> Tuple[int, dict]:
+        item_id = str(next(self._ids))
+        if path.endswith("/messages/send"):
+            return 200, {"id": item_id, "threadId": item_id, "labelIds": ["SENT"]}
+        if path.endswith("/events"):
+            return 200, {"id": item_id, "status": "confirmed", "htmlLink": f"http://stand-in/event/{item_id}"}
+        if path.endswith("/2/tweets"):
+            return 201, {"data": {"id": item_id, "text": json.loads(payload or b"{}").get("text", "")}}
+        return 404, {"error": f"unknown endpoint {path}"}
+
+    def route_batch(self, payload: bytes) -> Tuple[int, str, bytes]:
+        """Answer a Google batch request part by part, echoing each Content-ID"""
+        content_type = self.headers.get("Content-Type", "")
+        message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + payload)
+        boundary = f"batch_{uuid.uuid4().hex}"
+        lines = []
+        for part in message.get_payload() or []:
+            content_id = part.get("Content-ID", "").strip().strip("<>")
+            head, _, body = part.get_payload().replace("\r\n", "\n").partition("\n\n")
+            path = head.split("\n", 1)[0].split()[1]
+            status, response = self.route(path, body.encode())
+            data = json.dumps(response)
+            lines += [
+                f"--{boundary}",
+                "Content-Type: application/http",
+                f"Content-ID: <response-{content_id}>",
+                "",
+                f"HTTP/1.1 {status} OK",
+                "Content-Type: application/json; charset=UTF-8",
+                "",
+                data,
+            ]
+        lines.append(f"--{boundary}--")
+        return 200, f"multipart/mixed; boundary={boundary}", "\r\n".join(lines).encode()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog of 5 resets connections under concurrent load
+    request_queue_size = 1024
+
+
+def start_standin_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 50) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the server on a background thread; returns (server, base_url)"""
+    handler = type("ConfiguredStandInHandler", (StandInHandler,), {"latency_s": latency_ms / 1000})
+    server = StandInServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="tool-standin", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Stand-in Gmail/Calendar/X API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_standin_server(args.host, args.port, args.latency_ms)
+    print(f"Stand-in tool APIs on {base_url} ({args.latency_ms}ms latency), Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Local stand-in receiver for workflow completion webhooks
+Prints each delivery, can fail the first attempts of every delivery to exercise
+retries, and checks X-Factory-Signature when given the shared secret
+
+Usage (from coral_factory/):
+    python -m benchmarks.webhook_receiver --port 8766 --fail-first 2 [--secret s3cret]
+
+then start workflows with "callback_url": "http://127.0.0.1:8766/hook", with
+WEBHOOK_ALLOW_PRIVATE=true on the app (loopback callbacks are refused otherwise)
+and WEBHOOK_SECRET=s3cret when using --secret
+"""
+
+import argparse
+import hmac
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from factory.webhooks import sign_payload
+
+
+class WebhookReceiverHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fail_first = 0
+    fail_status = 503
+    secret: Optional[str] = None
+    quiet = False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        delivery_id = self.headers.get("X-Factory-Delivery", "")
+        server: WebhookReceiver = self.server
+
+        with server.lock:
+            server.attempts[delivery_id] += 1
+            attempt = server.attempts[delivery_id]
+
+        if self.secret is not None:
+            expected = sign_payload(body, self.secret)
+            if not hmac.compare_digest(expected, self.headers.get("X-Factory-Signature", "")):
+                return self.reply(401, {"error": "bad signature"})
+        if attempt <= self.fail_first:
+            return self.reply(self.fail_status, {"error": f"failing attempt {attempt} on purpose"})
+
+        payload = json.loads(body or b"{}")
+        with server.lock:
+            duplicate = delivery_id in server.received_ids
+            server.received_ids.add(delivery_id)
+            if not duplicate:
+                server.deliveries.append(payload)
+        if not self.quiet:
+            print(f"📬 {delivery_id} attempt {attempt}{' (duplicate)' if duplicate else ''}: "
+                  f"status={payload.get('status')} result={str(payload.get('result'))[:80]!r}")
+        self.reply(200, {"received": True})
+
+    def reply(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.attempts: Counter = Counter()
+        self.received_ids = set()
+        self.deliveries: List[Dict[str, Any]] = []
+
+
+def start_webhook_receiver(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    fail_first: int = 0,
+    fail_status: int = 503,
+    secret: Optional[str] = None,
+    quiet: bool = False,
+) -> Tuple[WebhookReceiver, str]:
+    """Start the receiver on a background thread; returns (server, callback_url)"""
+    handler = type("ConfiguredWebhookReceiverHandler", (WebhookReceiverHandler,), {
+        "fail_first": fail_first,
+        "fail_status": fail_status,
+        "secret": secret,
+        "quiet": quiet,
+    })
+    server = WebhookReceiver((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="webhook-receiver", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/hook"
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Stand-in receiver for workflow completion webhooks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail this many attempts of each delivery")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--secret", default=None, help="Verify X-Factory-Signature with this secret")
+    args = parser.parse_args(argv)
+
+    server, url = start_webhook_receiver(args.host, args.port, args.fail_first, args.fail_status, args.secret)
+    print(f"Webhook receiver on {url} (failing first {args.fail_first} attempts), Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
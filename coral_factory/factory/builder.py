@@ -1,23 +1,26 @@
 from dotenv import load_dotenv
 import asyncio
 from pydantic import BaseModel
-from datetime import datetime
 from enum import Enum
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import os
+import time
+import uuid
 import logging
 
 # Use simple LiteLLM agent instead of openai-agents
-from factory.simple_agent import build_simple_agent, SimpleLiteLLMAgent
+from factory.simple_agent import SimpleLiteLLMAgent
 from factory.agent_one import AgentConfig
-from factory.trace_stream import OpenAIAgentsTracingProcessor
+from factory.trace_stream import get_tracing_processor
+from factory.workflow_context import get_current_workflow
+from factory.router import route_task
+from factory.dag import run_dag
+from factory.workflow_cache import get_workflow_cache
+from factory.manager import DELEGATION_PROTOCOL, run_manager_workflow
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Global variables
-agents = {}
-global_context = None
+AGENT_PARALLELISM = int(os.getenv("AGENT_PARALLELISM", "4"))
 
 class RelationsType(str, Enum):
     single = "single"
@@ -25,6 +28,7 @@ class RelationsType(str, Enum):
     chain = "chain"
     group_chat = "group-chat"
     triage = "triage"
+    dag = "dag"
 
 class WorkflowConfig(BaseModel):
     objective: str
@@ -32,58 +36,122 @@ class WorkflowConfig(BaseModel):
     model_name: str
     api_key: str
     agents: List[AgentConfig]
+    max_parallel_agents: Optional[int] = None  # Fan-out limit per workflow, defaults to AGENT_PARALLELISM
+    triage_max_agents: Optional[int] = None  # Agents a triage router may pick, defaults to TRIAGE_MAX_AGENTS
+    cache_completions: bool = False  # Reuse cached LLM completions for identical prompts
 
-async def delegate_task(agent_name: str, task: str):
+async def delegate_task(agents: Dict[str, SimpleLiteLLMAgent], agent_name: str, task: str, context: Dict[str, Any] = None):
     """Delegate task to a specific agent"""
     logging.info(f"Calling agent {agent_name} with task {task}")
-    result = await agents[agent_name].run(task, context=global_context)
+    result = await agents[agent_name].run(task, context=context)
     logging.info(f"Agent {agent_name} returned:\n{result[:100]}...\n\n")
     return result
 
 
-async def builder(json_config: Dict[str, Any], user_id: str, tracer: list):
+async def builder(workflow_config: WorkflowConfig, user_id: str, tracer: list):
     """
-    Builds the manager agent and returns it.
+    Builds the per-run agents and the manager overview.
 
-    Manager agent contains all the agents and can call them to solve the user's task.
+    The run-independent parts are compiled once per distinct config and cached;
+    each run only creates fresh agent instances with their own history.
     """
-    global agents
-    
-    # Build overview for manager agent
-    overview = "You are a manager agent. Solve the user's task by delegating tasks to the appropriate agents and delegating the tasks to them.\n"
-    overview += "Think step by step and do not ask the user for clarification, just execute the task as best as you can."
-    overview += "You have access to the following agents:\n"
-
-    for agent in json_config["agents"]:
-        overview += f"{agent['name']}: {agent['persona']}\n"
-
-    agents = {}
-    for agent in json_config["agents"]:
-
-        agent['context'] = {
-            "__system__": f"The time is {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        }
+    start = time.monotonic()
+    compiled = get_workflow_cache().get(workflow_config)
+    # Cached workflows get a date-only time context so same-day reruns send identical prompts
+    agents = compiled.instantiate(
+        api_key=workflow_config.api_key,
+        user_id=user_id,
+        tracer=tracer,
+        date_only=workflow_config.cache_completions,
+    )
+    logging.info(f"Built {len(agents)} agents in {(time.monotonic() - start) * 1000:.1f}ms (workflow {compiled.key[:12]})")
+    return agents, compiled.overview, compiled
+
+
+async def run_agents_concurrently(
+    agents: Dict[str, SimpleLiteLLMAgent],
+    user_task: str,
+    max_parallel: int,
+    tracer: list = None,
+    label: str = "fan-out",
+) -> List[str]:
+    """
+    Run independent agents on the same task at the same time.
 
-        agents[agent['name']] = await build_simple_agent(
-            agent_name=agent['name'],
-            user_id=user_id,
-            model_name=json_config["model_name"],
-            mcp_servers=agent['mcp_servers'],
-            toolkits=agent['toolkits'],
-            api_key=json_config["api_key"],
-            persona=agent['persona'],
-            output=agent['output'],
-            guidelines=agent['guidelines'],
-            context=agent['context'],
-            tracer=tracer
-        )
+    Results keep the agents' order and a failing agent only affects its own entry.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    durations_ms: Dict[str, float] = {}
 
-    return agents, overview
+    async def run_one(agent_name: str, agent: SimpleLiteLLMAgent) -> str:
+        async with semaphore:
+            logging.info(f"Running agent: {agent_name}")
+            start = time.monotonic()
+            try:
+                result = await agent.run(user_task)
+                logging.info(f"Agent {agent_name} completed")
+                return f"**{agent_name}:**\n{result}\n"
+            except Exception as e:
+                logging.error(f"Agent {agent_name} failed: {e}")
+                return f"**{agent_name}:** ❌ Failed - {str(e)}\n"
+            finally:
+                durations_ms[agent_name] = (time.monotonic() - start) * 1000
+
+    start = time.monotonic()
+    results = await asyncio.gather(*(run_one(name, agent) for name, agent in agents.items()))
+    wall_clock_ms = (time.monotonic() - start) * 1000
+    summed_agent_ms = sum(durations_ms.values())
+
+    logging.info(
+        f"{label} finished {len(agents)} agents in {wall_clock_ms:.0f}ms wall clock "
+        f"({summed_agent_ms:.0f}ms summed agent time, parallelism {max_parallel})"
+    )
+    await _save_fan_out_trace(tracer, label, max_parallel, durations_ms, wall_clock_ms)
+    return list(results)
+
+
+async def _save_fan_out_trace(tracer: list, label: str, max_parallel: int, durations_ms: Dict[str, float], wall_clock_ms: float):
+    """Record wall-clock against summed agent time for a fan-out"""
+    if not tracer:
+        return
+    summed_agent_ms = sum(durations_ms.values())
+    try:
+        await tracer[0].save_trace({
+            "trace_id": str(uuid.uuid4()),
+            "agent_name": label,
+            "status": "completed",
+            "span_type": "fan_out",
+            "max_parallel_agents": max_parallel,
+            "agent_durations_ms": durations_ms,
+            "duration_ms": wall_clock_ms,
+            "wall_clock_ms": wall_clock_ms,
+            "summed_agent_ms": summed_agent_ms,
+            "parallel_speedup": round(summed_agent_ms / wall_clock_ms, 2) if wall_clock_ms else None,
+        })
+    except Exception as e:
+        logging.error(f"Failed to save fan-out trace: {e}")
+
+
+async def _save_router_trace(tracer: list, router: str, selected: List[str], candidates: List[str]):
+    """Record which agents the triage router picked"""
+    if not tracer:
+        return
+    try:
+        await tracer[0].save_trace({
+            "trace_id": str(uuid.uuid4()),
+            "agent_name": "triage-router",
+            "status": "completed",
+            "span_type": "router",
+            "router": router,
+            "selected_agents": selected,
+            "candidate_agents": candidates,
+        })
+    except Exception as e:
+        logging.error(f"Failed to save router trace: {e}")
 
 
 async def start_agents(workflow_config: WorkflowConfig, user_task: str, user_id: str):
-    global global_context
-    global_context = {
+    context = {
         "user_id": user_id,
     }
 
@@ -91,57 +159,45 @@ async def start_agents(workflow_config: WorkflowConfig, user_task: str, user_id:
     os.environ["GEMINI_API_KEY"] = workflow_config.api_key
     logging.warning(f"SET GEMINI_API_KEY IN ENVIRONMENT: {workflow_config.api_key[:20]}...")
 
-    tracer = None
-    firebase_project_id = os.getenv("FIREBASE_PROJECT_ID")
-    firebase_service_account_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
-    
-    logging.info(f"Firebase config check:")
-    logging.info(f"  FIREBASE_PROJECT_ID: {firebase_project_id}")
-    logging.info(f"  FIREBASE_SERVICE_ACCOUNT_PATH: {firebase_service_account_path}")
-    logging.info(f"  user_id: {user_id}")
-    
-    if firebase_project_id and firebase_service_account_path:
-        logging.info("Creating OpenAIAgentsTracingProcessor...")
-        try:
-            tracer = [OpenAIAgentsTracingProcessor(
-                firebase_project_id=firebase_project_id,
-                firebase_service_account_path=firebase_service_account_path,
-                user_id=user_id
-            )]
-            logging.info("Tracer created successfully!")
-        except Exception as e:
-            logging.error(f"Failed to create tracer: {e}")
-            import traceback
-            logging.error(traceback.format_exc())
-    else:
-        logging.warning("Firebase not configured - traces will not be saved!")
+    # One shared tracing processor for all workflows, scoped per call by user_id
+    setup_start = time.monotonic()
+    processor = get_tracing_processor()
+    tracer = [processor] if processor else None
+    tracer_setup_ms = (time.monotonic() - setup_start) * 1000
 
     if len(workflow_config.agents) == 0:
         raise ValueError("No agents provided")
 
-    builder_json = workflow_config.model_dump()
-    agents, overview = await builder(builder_json, user_id=user_id, tracer=tracer)
+    agents, overview, compiled = await builder(workflow_config, user_id=user_id, tracer=tracer)
+    workflow = get_current_workflow()
+    if workflow:
+        workflow.record_timing("tracer_setup", tracer_setup_ms)
+        workflow.record_timing("workflow_setup", (time.monotonic() - setup_start) * 1000)
+    max_parallel = workflow_config.max_parallel_agents or AGENT_PARALLELISM
 
     if workflow_config.relations_type == "manager":
-        # Manager: Run all agents in sequence, each building on the previous
+        # Manager: A manager agent delegates to the agents it needs, in parallel
         logging.info(f"Starting manager workflow with {len(agents)} agents")
-        results = []
-        current_task = user_task
-        
-        for agent_name, agent in agents.items():
-            logging.info(f"Running agent: {agent_name}")
-            try:
-                result = await agent.run(current_task)
-                results.append(f"**{agent_name}:**\n{result}\n")
-                # Pass the result to the next agent as context
-                current_task = f"Previous agent ({agent_name}) output:\n{result}\n\nOriginal task: {user_task}\n\nContinue with your part of the workflow."
-                logging.info(f"Agent {agent_name} completed successfully")
-            except Exception as e:
-                logging.error(f"Agent {agent_name} failed: {e}")
-                results.append(f"**{agent_name}:** ❌ Failed - {str(e)}\n")
-        
-        # Combine all results
-        final_result = "\n---\n\n".join(results)
+        manager = SimpleLiteLLMAgent(
+            name="Manager",
+            model=next(iter(agents.values())).model,
+            instructions=overview + DELEGATION_PROTOCOL,
+            api_key=workflow_config.api_key,
+            temperature=0.3,
+            tracer=tracer,
+            user_id=user_id,
+            enable_tools=False
+        )
+
+        async def delegate(agent_name: str, task: str) -> str:
+            return await delegate_task(agents, agent_name, task, context=context)
+
+        start = time.monotonic()
+        final_result, stats = await run_manager_workflow(
+            manager, list(agents), delegate, user_task, max_parallel
+        )
+        logging.info(f"Manager finished after {stats['rounds']} rounds and {stats['delegations']} delegations")
+        await _save_fan_out_trace(tracer, "manager", max_parallel, stats["agent_durations_ms"], (time.monotonic() - start) * 1000)
         return final_result
 
     elif workflow_config.relations_type == "chain":
@@ -157,40 +213,44 @@ async def start_agents(workflow_config: WorkflowConfig, user_task: str, user_id:
         return current_output
 
     elif workflow_config.relations_type == "group-chat":
-        # Group chat: All agents process the task and combine results
+        # Group chat: All agents process the task concurrently and combine results
         logging.info(f"Starting group chat with {len(agents)} agents")
-        results = []
-        
-        for agent_name, agent in agents.items():
-            logging.info(f"Running agent: {agent_name}")
-            try:
-                result = await agent.run(user_task)
-                results.append(f"**{agent_name}:**\n{result}\n")
-                logging.info(f"Agent {agent_name} completed")
-            except Exception as e:
-                logging.error(f"Agent {agent_name} failed: {e}")
-                results.append(f"**{agent_name}:** ❌ Failed - {str(e)}\n")
-        
+        results = await run_agents_concurrently(
+            agents, user_task, max_parallel, tracer=tracer, label="group-chat"
+        )
         return "\n---\n\n".join(results)
 
     elif workflow_config.relations_type == "triage":
-        # Triage: Use first agent to route, then execute appropriate agent
-        # For now, run all agents in sequence
+        # Triage: One router step picks the agent(s), then only those run
         logging.info(f"Starting triage workflow with {len(agents)} agents")
-        results = []
-        
-        for agent_name, agent in agents.items():
-            logging.info(f"Running agent: {agent_name}")
-            try:
-                result = await agent.run(user_task)
-                results.append(f"**{agent_name}:**\n{result}\n")
-                logging.info(f"Agent {agent_name} completed")
-            except Exception as e:
-                logging.error(f"Agent {agent_name} failed: {e}")
-                results.append(f"**{agent_name}:** ❌ Failed - {str(e)}\n")
-        
+        personas = {agent.name: agent.persona for agent in workflow_config.agents}
+        router_kwargs = {}
+        if workflow_config.triage_max_agents:
+            router_kwargs["max_agents"] = workflow_config.triage_max_agents
+        selected, router = await route_task(
+            user_task,
+            personas,
+            model=next(iter(agents.values())).model,
+            api_key=workflow_config.api_key,
+            **router_kwargs
+        )
+        logging.info(f"Triage router ({router}) selected: {', '.join(selected)}")
+        await _save_router_trace(tracer, router, selected, list(personas))
+
+        chosen_agents = {name: agents[name] for name in selected}
+        results = await run_agents_concurrently(
+            chosen_agents, user_task, max_parallel, tracer=tracer, label="triage"
+        )
         return "\n---\n\n".join(results)
 
+    elif workflow_config.relations_type == "dag":
+        # DAG: Each agent runs as soon as the agents it depends on are done
+        logging.info(f"Starting DAG workflow with {len(agents)} agents")
+        start = time.monotonic()
+        final_result, durations_ms = await run_dag(agents, compiled.dag_dependencies, user_task, max_parallel)
+        await _save_fan_out_trace(tracer, "dag", max_parallel, durations_ms, (time.monotonic() - start) * 1000)
+        return final_result
+
     elif workflow_config.relations_type == "single":
         first_agent_name = workflow_config.agents[0].name
         first_agent = agents[first_agent_name]
@@ -0,0 +1,224 @@
+"""
+Concurrency limiter
+Caps on in-flight async calls, shared safely across event loops and threads,
+and an AIMD controller that adapts a cap to provider backpressure
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of in-flight calls across the whole process.
+
+    Waiters are plain futures tied to their own event loop, so the limiter
+    can be shared safely by every loop and thread in the process.
+    """
+
+    def __init__(self, limit: int, name: str = "llm"):
+        if limit < 1:
+            raise ValueError("Concurrency limit must be at least 1")
+        self.name = name
+        self._limit = limit
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+        # Stats
+        self._peak_in_flight = 0
+        self._completed = 0
+        self._total_wait_s = 0.0
+        self._total_busy_s = 0.0
+        self._started_at = time.monotonic()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def set_limit(self, limit: int) -> None:
+        """Change the cap at runtime, waking waiters if it was raised"""
+        if limit < 1:
+            raise ValueError("Concurrency limit must be at least 1")
+        with self._lock:
+            self._limit = limit
+            self._wake_waiters_locked()
+
+    async def acquire(self) -> float:
+        """Wait for a free slot and return how long the caller waited (seconds)"""
+        start = time.monotonic()
+        with self._lock:
+            if self._in_flight < self._limit and not self._waiters:
+                self._take_slot_locked()
+                return 0.0
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    # Slot was handed over just before cancellation, give it back
+                    self._return_slot_locked()
+                else:
+                    # Still queued; if it was already popped, _hand_over returns the slot
+                    try:
+                        self._waiters.remove((loop, waiter))
+                    except ValueError:
+                        pass
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._total_wait_s += waited
+        return waited
+
+    def release(self, busy_s: float = 0.0) -> None:
+        with self._lock:
+            self._completed += 1
+            self._total_busy_s += busy_s
+            self._return_slot_locked()
+
+    def _take_slot_locked(self) -> None:
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _return_slot_locked(self) -> None:
+        self._in_flight -= 1
+        self._wake_waiters_locked()
+
+    def _wake_waiters_locked(self) -> None:
+        while self._waiters and self._in_flight < self._limit:
+            loop, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._take_slot_locked()
+            loop.call_soon_threadsafe(self._hand_over, waiter)
+
+    def _hand_over(self, waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
+            return
+        # Waiter was cancelled before the slot reached it, pass the slot on
+        with self._lock:
+            self._return_slot_locked()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current limiter state, used to measure throughput against the cap"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "name": self.name,
+                "limit": self._limit,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "peak_in_flight": self._peak_in_flight,
+                "completed": self._completed,
+                "throughput_per_s": round(self._completed / elapsed, 3),
+                "avg_wait_ms": round(self._total_wait_s * 1000 / max(self._completed, 1), 2),
+                "avg_call_ms": round(self._total_busy_s * 1000 / max(self._completed, 1), 2),
+            }
+
+
+class AIMDController:
+    """
+    Adapts a limiter's cap to provider backpressure (additive increase,
+    multiplicative decrease).
+
+    Each success while the window is in use grows it by 1/window, so about
+    +1 per window's worth of calls. A 429 or timeout cuts it by `decrease`.
+    So does a short-term latency average rising above `latency_tolerance`
+    times the long-term one. At most one cut is applied per `cooldown_s`, so
+    a single burst of errors does not collapse the window to the minimum.
+    """
+
+    def __init__(
+        self,
+        limiter: ConcurrencyLimiter,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        decrease: float = 0.5,
+        latency_decrease: float = 0.9,
+        latency_tolerance: float = 2.0,
+        cooldown_s: float = 2.0,
+    ):
+        self.limiter = limiter
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.decrease = decrease
+        self.latency_decrease = latency_decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_s = cooldown_s
+        self._window = float(min(max(limiter.limit, self.min_limit), self.max_limit))
+        self._short_latency = None
+        self._long_latency = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"increases": 0, "decreases": 0, "suppressed": 0}
+        self._decrease_reasons: Dict[str, int] = {}
+        limiter.set_limit(int(self._window))
+
+    @property
+    def window(self) -> float:
+        return self._window
+
+    def on_success(self, latency_s: float) -> None:
+        with self._lock:
+            if self._short_latency is None:
+                self._short_latency = self._long_latency = latency_s
+            else:
+                self._short_latency += 0.2 * (latency_s - self._short_latency)
+                self._long_latency += 0.02 * (latency_s - self._long_latency)
+            if self._short_latency > self._long_latency * self.latency_tolerance:
+                self._decrease_locked("latency", self.latency_decrease)
+                return
+            # Only grow when the window is actually the constraint
+            if self.limiter.in_flight >= int(self._window) - 1 and self._window < self.max_limit:
+                self._window = min(self.max_limit, self._window + 1.0 / self._window)
+                self._stats["increases"] += 1
+                self._apply_locked()
+
+    def on_backpressure(self, reason: str) -> None:
+        with self._lock:
+            self._decrease_locked(reason, self.decrease)
+
+    def _decrease_locked(self, reason: str, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_s:
+            self._stats["suppressed"] += 1
+            return
+        self._last_decrease = now
+        self._window = max(float(self.min_limit), self._window * factor)
+        self._stats["decreases"] += 1
+        self._decrease_reasons[reason] = self._decrease_reasons.get(reason, 0) + 1
+        if reason == "latency":
+            # Accept the new latency level as the baseline instead of cutting again
+            self._long_latency = self._short_latency
+        self._apply_locked()
+
+    def _apply_locked(self) -> None:
+        limit = int(self._window)
+        if limit != self.limiter.limit:
+            self.limiter.set_limit(limit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.limiter.snapshot(),
+                "window": round(self._window, 2),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                **self._stats,
+                "decrease_reasons": dict(self._decrease_reasons),
+                "short_latency_ms": round((self._short_latency or 0) * 1000, 1),
+                "long_latency_ms": round((self._long_latency or 0) * 1000, 1),
+            }
@@ -0,0 +1,113 @@
+"""
+DAG workflow executor
+Runs each agent as soon as the agents it depends on have finished
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def validate_dag(agent_configs: List[Any]) -> Dict[str, List[str]]:
+    """
+    Check the declared dependencies and return them in topological order.
+
+    Raises ValueError for unknown agents, duplicate names and cycles.
+    """
+    dependencies: Dict[str, List[str]] = {}
+    for config in agent_configs:
+        if config.name in dependencies:
+            raise ValueError(f"Duplicate agent name in DAG: {config.name}")
+        dependencies[config.name] = list(dict.fromkeys(config.depends_on))
+
+    for name, deps in dependencies.items():
+        for dep in deps:
+            if dep == name:
+                raise ValueError(f"Agent {name} cannot depend on itself")
+            if dep not in dependencies:
+                raise ValueError(f"Agent {name} depends on unknown agent {dep}")
+
+    # Kahn's algorithm, keeping the configured order among ready agents
+    remaining = {name: set(deps) for name, deps in dependencies.items()}
+    ordered: Dict[str, List[str]] = {}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"DAG has a cycle between: {', '.join(remaining)}")
+        for name in ready:
+            ordered[name] = dependencies[name]
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return ordered
+
+
+def _join_inputs(user_task: str, upstream: List[Tuple[str, str]]) -> str:
+    """Merge upstream outputs into the input of a join node"""
+    sections = "\n\n".join(f"### {name}:\n{output}" for name, output in upstream)
+    return (
+        f"Original task: {user_task}\n\n"
+        f"Outputs from upstream agents:\n\n{sections}\n\n"
+        "Continue with your part of the workflow."
+    )
+
+
+async def run_dag(
+    agents: Dict[str, Any],
+    dependencies: Dict[str, List[str]],
+    user_task: str,
+    max_parallel: int,
+) -> Tuple[str, Dict[str, float]]:
+    """
+    Execute the DAG with at most max_parallel agents running at once.
+
+    Returns:
+        (final_output, durations_ms) - Combined output of the sink agents, and per-agent run time
+    """
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    durations_ms: Dict[str, float] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_node(name: str) -> Tuple[bool, str]:
+        upstream = []
+        for dep in dependencies[name]:
+            ok, output = await tasks[dep]
+            if not ok:
+                return False, f"⏭️ Skipped - upstream agent {dep} did not complete"
+            upstream.append((dep, output))
+
+        node_input = _join_inputs(user_task, upstream) if upstream else user_task
+        async with semaphore:
+            logger.info(f"Running agent: {name}")
+            start = time.monotonic()
+            try:
+                result = await agents[name].run(node_input)
+                logger.info(f"Agent {name} completed")
+                return True, result
+            except Exception as e:
+                logger.error(f"Agent {name} failed: {e}")
+                return False, f"❌ Failed - {str(e)}"
+            finally:
+                durations_ms[name] = (time.monotonic() - start) * 1000
+
+    # Dependencies are ordered, so every upstream task exists before its dependents
+    for name in dependencies:
+        tasks[name] = asyncio.create_task(run_node(name))
+    await asyncio.gather(*tasks.values())
+
+    consumed = {dep for deps in dependencies.values() for dep in deps}
+    sinks = [name for name in dependencies if name not in consumed]
+    if len(sinks) == 1:
+        ok, output = tasks[sinks[0]].result()
+        if not ok:
+            raise RuntimeError(f"Agent {sinks[0]}: {output}")
+        return output, durations_ms
+
+    results = []
+    for name in sinks:
+        ok, output = tasks[name].result()
+        results.append(f"**{name}:**\n{output}\n" if ok else f"**{name}:** {output}\n")
+    return "\n---\n\n".join(results), durations_ms
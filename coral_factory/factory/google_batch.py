@@ -0,0 +1,72 @@
+"""
+Google API batch requests
+Encodes several REST calls into one multipart/mixed request and maps the
+sub-responses back by Content-ID
+"""
+
+import json
+import logging
+import uuid
+from email.parser import BytesParser
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+GMAIL_BATCH_PATH = "/batch/gmail/v1"
+CALENDAR_BATCH_PATH = "/batch/calendar/v3"
+
+
+def encode_batch(parts: List[Tuple[str, str, str, Dict[str, Any]]]) -> Tuple[str, bytes]:
+    """
+    Build a batch body from (content_id, method, path, json_body) parts.
+
+    Returns (content_type, body) for the outer POST.
+    """
+    boundary = f"batch_{uuid.uuid4().hex}"
+    lines = []
+    for content_id, method, path, body in parts:
+        payload = json.dumps(body)
+        lines += [
+            f"--{boundary}",
+            "Content-Type: application/http",
+            f"Content-ID: <{content_id}>",
+            "",
+            f"{method} {path} HTTP/1.1",
+            "Content-Type: application/json",
+            f"Content-Length: {len(payload.encode())}",
+            "",
+            payload,
+        ]
+    lines.append(f"--{boundary}--")
+    return f"multipart/mixed; boundary={boundary}", "\r\n".join(lines).encode()
+
+
+def decode_batch(content_type: str, content: bytes) -> Dict[str, Tuple[int, Any]]:
+    """Map each sub-response's Content-ID (without the 'response-' prefix) to (status, json)"""
+    message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + content)
+    responses = {}
+    for part in message.get_payload() or []:
+        content_id = part.get("Content-ID", "").strip().strip("<>")
+        if content_id.startswith("response-"):
+            content_id = content_id[len("response-"):]
+
+        raw = part.get_payload()
+        if isinstance(raw, list):
+            # Parsed as a nested message; fall back to its text
+            raw = raw[0].as_string()
+        head, _, body = raw.replace("\r\n", "\n").partition("\n\n")
+        status_line = head.split("\n", 1)[0].split()
+        status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 500
+        try:
+            data = json.loads(body) if body.strip() else {}
+        except ValueError:
+            data = {"raw": body.strip()}
+        responses[content_id] = (status, data)
+    return responses
+
+
+def batch_error_message(status: int, data: Any) -> str:
+    """Short error text for a failed sub-response"""
+    if isinstance(data, dict) and isinstance(data.get("error"), dict):
+        return f"HTTP {status}: {data['error'].get('message', '')}".strip()
+    return f"HTTP {status}"
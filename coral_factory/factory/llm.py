@@ -0,0 +1,219 @@
+"""
+Shared LLM call path for all agents
+Non-blocking LiteLLM completions gated by per-provider rate limits, an
+adaptive (AIMD) concurrency window per model and a process-wide concurrency limiter
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import litellm
+
+from factory.concurrency import AIMDController, ConcurrencyLimiter
+from factory.llm_cache import completion_cache_key, completion_scope, get_completion_cache
+from factory.rate_limit import estimate_prompt_tokens, estimate_tokens, get_rate_limiter, provider_for_model
+from factory.workflow_context import get_current_workflow
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+# Stream tokens to workflow event subscribers (stream=True) instead of waiting for the full reply
+LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+
+# Adaptive per-model window, bounded by LLM_MAX_CONCURRENCY
+LLM_ADAPTIVE_CONCURRENCY = os.getenv("LLM_ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+LLM_AIMD_INITIAL = int(os.getenv("LLM_AIMD_INITIAL", "8"))
+LLM_AIMD_MIN = int(os.getenv("LLM_AIMD_MIN", "1"))
+LLM_AIMD_DECREASE = float(os.getenv("LLM_AIMD_DECREASE", "0.5"))
+LLM_AIMD_LATENCY_TOLERANCE = float(os.getenv("LLM_AIMD_LATENCY_TOLERANCE", "2.0"))
+LLM_AIMD_COOLDOWN_SECONDS = float(os.getenv("LLM_AIMD_COOLDOWN_SECONDS", "2.0"))
+
+
+# Global instance
+_llm_limiter: Optional[ConcurrencyLimiter] = None
+_llm_limiter_lock = threading.Lock()
+
+def get_llm_limiter() -> ConcurrencyLimiter:
+    """Get or create the process-wide LLM concurrency limiter"""
+    global _llm_limiter
+    if _llm_limiter is None:
+        with _llm_limiter_lock:
+            if _llm_limiter is None:
+                _llm_limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENCY, name="llm")
+                logger.info(f"LLM concurrency limiter created (limit: {LLM_MAX_CONCURRENCY})")
+    return _llm_limiter
+
+
+_model_controllers: Dict[str, AIMDController] = {}
+_model_controllers_lock = threading.Lock()
+
+def get_model_controller(model: str) -> Optional[AIMDController]:
+    """Adaptive concurrency window for one model, or None when disabled"""
+    if not LLM_ADAPTIVE_CONCURRENCY:
+        return None
+    controller = _model_controllers.get(model)
+    if controller is None:
+        with _model_controllers_lock:
+            controller = _model_controllers.get(model)
+            if controller is None:
+                controller = AIMDController(
+                    ConcurrencyLimiter(min(LLM_AIMD_INITIAL, LLM_MAX_CONCURRENCY), name=model),
+                    min_limit=LLM_AIMD_MIN,
+                    max_limit=LLM_MAX_CONCURRENCY,
+                    decrease=LLM_AIMD_DECREASE,
+                    latency_tolerance=LLM_AIMD_LATENCY_TOLERANCE,
+                    cooldown_s=LLM_AIMD_COOLDOWN_SECONDS,
+                )
+                _model_controllers[model] = controller
+                logger.info(f"Adaptive concurrency for {model} (window: {controller.window:.0f}, max: {LLM_MAX_CONCURRENCY})")
+    return controller
+
+
+def model_concurrency_stats() -> Dict[str, Any]:
+    return {model: controller.snapshot() for model, controller in list(_model_controllers.items())}
+
+
+def _backpressure_reason(error: BaseException) -> Optional[str]:
+    """Classify provider errors that mean 'send less' (None for anything else)"""
+    if isinstance(error, litellm.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, (litellm.Timeout, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, litellm.ServiceUnavailableError):
+        return "overloaded"
+    return None
+
+
+async def acomplete(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.7,
+    api_key: Optional[str] = None,
+    timeout: float = LLM_TIMEOUT_SECONDS,
+    cache: Optional[bool] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    **kwargs,
+) -> str:
+    """
+    Run a non-blocking completion and return the assistant message content.
+
+    The completion cache is used when `cache` is True, or when it is None and
+    the running workflow opted in with cache_completions.
+
+    With `on_token` the completion is streamed and each content delta is passed
+    to it as it arrives; a cached answer is delivered as a single chunk.
+    """
+    workflow = get_current_workflow()
+    if cache is None:
+        cache = bool(workflow and workflow.cache_completions)
+
+    async def compute() -> str:
+        return await _complete(model, messages, temperature, api_key, timeout, on_token, **kwargs)
+
+    if not cache:
+        return await compute()
+
+    scope = completion_scope(api_key, workflow.user_id if workflow else None)
+    key = completion_cache_key(model, messages, temperature, scope=scope, **kwargs)
+    value, outcome = await get_completion_cache().get_or_compute(key, compute)
+    if on_token is not None and outcome != "miss":
+        on_token(value)
+    if workflow:
+        workflow.record("llm_cache", "misses" if outcome == "miss" else "hits")
+        if outcome != "miss":
+            workflow.record("llm_cache", outcome)
+    return value
+
+
+async def _complete(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    api_key: Optional[str],
+    timeout: float,
+    on_token: Optional[Callable[[str], None]] = None,
+    **kwargs,
+) -> str:
+    # Wait for provider budget before taking a slot, so slots are not held while throttled
+    workflow = get_current_workflow()
+    reservation = await get_rate_limiter().acquire(
+        provider_for_model(model),
+        api_key=api_key,
+        user_id=workflow.user_id if workflow else None,
+        tokens=estimate_tokens(messages, kwargs.get("max_tokens")),
+    )
+
+    controller = get_model_controller(model)
+    limiter = get_llm_limiter()
+    try:
+        if controller is not None:
+            await controller.limiter.acquire()
+        try:
+            waited = await limiter.acquire()
+        except BaseException:
+            if controller is not None:
+                controller.limiter.release()
+            raise
+    except BaseException:
+        # Nothing was sent: give the budget back
+        reservation.cancel()
+        raise
+    if waited > 1:
+        logger.info(f"⏳ Waited {waited:.2f}s for an LLM slot ({model})")
+
+    start = time.monotonic()
+    try:
+        request = dict(model=model, messages=messages, temperature=temperature, api_key=api_key, timeout=timeout, **kwargs)
+        if on_token is None:
+            response = await litellm.acompletion(**request)
+            content = response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            latency_s = time.monotonic() - start
+        else:
+            content, usage, latency_s = await _stream_completion(request, on_token)
+    except BaseException as e:
+        reason = _backpressure_reason(e)
+        if controller is not None and reason:
+            logger.warning(f"⚠️ {model} backpressure ({reason}), shrinking concurrency window")
+            controller.on_backpressure(reason)
+        # The request went out but no answer came back: keep the prompt charged, not the completion estimate
+        reservation.settle(estimate_prompt_tokens(messages))
+        raise
+    finally:
+        busy_s = time.monotonic() - start
+        limiter.release(busy_s=busy_s)
+        if controller is not None:
+            controller.limiter.release(busy_s=busy_s)
+
+    if controller is not None:
+        # Streams report time to first chunk: answer length and token consumers are not provider load
+        controller.on_success(latency_s)
+    reservation.settle(getattr(usage, "total_tokens", None))
+    return content
+
+
+async def _stream_completion(request: Dict[str, Any], on_token: Callable[[str], None]):
+    """Stream a completion through on_token; returns (content, usage, seconds to the first chunk)"""
+    start = time.monotonic()
+    stream = await litellm.acompletion(stream=True, stream_options={"include_usage": True}, **request)
+    parts = []
+    usage = None
+    first_chunk_s = None
+    async for chunk in stream:
+        if first_chunk_s is None:
+            first_chunk_s = time.monotonic() - start
+        usage = getattr(chunk, "usage", None) or usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            on_token(delta)
+    if first_chunk_s is None:
+        first_chunk_s = time.monotonic() - start
+    return "".join(parts), usage, first_chunk_s
@@ -0,0 +1,235 @@
+"""
+LLM completion cache
+Bounded in-memory LRU, optional SQLite tier with TTL and size eviction,
+and single-flight coalescing of identical in-flight requests
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")  # Empty disables the disk tier
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_DB_MAX_BYTES = int(os.getenv("LLM_CACHE_DB_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def completion_scope(api_key: Optional[str], user_id: Optional[str]) -> str:
+    """Tenant a cached completion belongs to: hashed API key and user, never shared across them"""
+    return hashlib.sha256(f"{api_key or ''}\x00{user_id or ''}".encode()).hexdigest()
+
+
+def completion_cache_key(model: str, messages: List[Dict[str, Any]], temperature: float, scope: str = "", **kwargs) -> str:
+    """Stable key for a completion request within one tenant `scope` (see completion_scope)"""
+    payload = json.dumps(
+        {"scope": scope, "model": model, "messages": messages, "temperature": temperature, "params": kwargs},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DiskCompletionStore:
+    """SQLite tier: entries expire after a TTL and the least recently used go first past max_bytes"""
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._delete_locked(key)
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode())
+        with self._lock:
+            self._delete_locked(key)
+            self._conn.execute(
+                "INSERT INTO completions (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._total_bytes += size
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def _delete_locked(self, key: str) -> None:
+        row = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._total_bytes -= row[0]
+
+    def _evict_locked(self, now: float) -> None:
+        expired = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM completions WHERE created_at < ?",
+            (now - self.ttl_seconds,),
+        ).fetchone()
+        if expired[1]:
+            self._conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._total_bytes -= expired[0]
+
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM completions ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            self._conn.executemany("DELETE FROM completions WHERE key = ?", [(key,) for key, _ in rows])
+            self._total_bytes -= sum(size for _, size in rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return {"path": self.path, "entries": entries, "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+class CompletionCache:
+    """Two-tier completion cache with single-flight coalescing"""
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        disk: Optional[DiskCompletionStore] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk = disk
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._counters = {"memory_hit": 0, "disk_hit": 0, "coalesced": 0, "miss": 0}
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if time.monotonic() - created_at > self.ttl_seconds:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: str) -> None:
+        self._memory[key] = (value, time.monotonic())
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """
+        Return a cached completion or compute it once for all concurrent callers.
+
+        Returns:
+            (value, outcome) - outcome is memory_hit, disk_hit, coalesced or miss
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self._counters["memory_hit"] += 1
+            return value, "memory_hit"
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self._counters["coalesced"] += 1
+            return await asyncio.shield(pending), "coalesced"
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            outcome = "miss"
+            value = await self._disk_call("get", key)
+            if value is not None:
+                outcome = "disk_hit"
+            else:
+                value = await compute()
+                if value is not None:
+                    await self._disk_call("put", key, value)
+            if value is not None:
+                self._memory_put(key, value)
+            self._counters[outcome] += 1
+            future.set_result(value)
+            return value, outcome
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Completion cancelled"))
+            future.exception()  # Mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def _disk_call(self, method: str, *args) -> Optional[str]:
+        """Run a disk tier operation off the event loop; disk errors never fail a completion"""
+        if not self.disk:
+            return None
+        try:
+            return await asyncio.to_thread(getattr(self.disk, method), *args)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM cache disk {method} failed: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self._counters.values())
+        hits = lookups - self._counters["miss"]
+        return {
+            **self._counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self.max_entries,
+            "in_flight": len(self._in_flight),
+            "disk": self.disk.stats() if self.disk else None,
+        }
+
+
+# Global instance
+_completion_cache: Optional[CompletionCache] = None
+_completion_cache_lock = threading.Lock()
+
+def get_completion_cache() -> CompletionCache:
+    """Get or create the process-wide completion cache"""
+    global _completion_cache
+    if _completion_cache is None:
+        with _completion_cache_lock:
+            if _completion_cache is None:
+                disk = None
+                if LLM_CACHE_DB_PATH:
+                    try:
+                        disk = DiskCompletionStore(LLM_CACHE_DB_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_DB_MAX_BYTES)
+                        logger.info(f"✅ LLM cache disk tier at {LLM_CACHE_DB_PATH}")
+                    except Exception as e:
+                        logger.warning(f"⚠️ LLM cache disk tier disabled: {e}")
+                _completion_cache = CompletionCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, disk=disk)
+    return _completion_cache
@@ -0,0 +1,119 @@
+"""
+Dynamic manager workflow
+The manager agent delegates tasks to sub-agents, several per turn, and the
+delegations run concurrently before their results are fed back to it.
+Delegations to the same agent run one after another, since they share the
+agent's conversation history
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANAGER_MAX_ROUNDS = int(os.getenv("MANAGER_MAX_ROUNDS", "3"))
+MANAGER_MAX_DELEGATIONS_PER_ROUND = int(os.getenv("MANAGER_MAX_DELEGATIONS_PER_ROUND", "5"))
+MANAGER_MAX_DELEGATIONS = int(os.getenv("MANAGER_MAX_DELEGATIONS", "10"))
+
+DELEGATION_PROTOCOL = """
+
+HOW TO DELEGATE:
+- To give work to agents, reply with one line per delegation:
+  DELEGATE: agent=AgentName | task=What this agent should do
+- You can delegate to several agents in one reply; they work at the same time
+- Only call the agents the task actually needs
+- You will receive their results and can delegate again or finish
+- When you have everything you need, reply with:
+  FINAL_ANSWER: your complete answer for the user
+"""
+
+DELEGATE_PATTERN = re.compile(r"^\s*DELEGATE:\s*agent=([^|\n]+)\|\s*task=(.+)$", re.MULTILINE)
+FINAL_PATTERN = re.compile(r"FINAL_ANSWER:\s*", re.MULTILINE)
+
+
+def parse_delegations(reply: str) -> List[Tuple[str, str]]:
+    """Extract (agent_name, task) pairs from a manager reply"""
+    return [(match.group(1).strip(), match.group(2).strip()) for match in DELEGATE_PATTERN.finditer(reply or "")]
+
+
+def extract_final_answer(reply: str) -> str:
+    match = FINAL_PATTERN.search(reply or "")
+    return reply[match.end():].strip() if match else (reply or "").strip()
+
+
+async def run_manager_workflow(
+    manager: Any,
+    agent_names: List[str],
+    delegate: Callable[[str, str], Awaitable[str]],
+    user_task: str,
+    max_parallel: int,
+    max_rounds: int = MANAGER_MAX_ROUNDS,
+    max_per_round: int = MANAGER_MAX_DELEGATIONS_PER_ROUND,
+    max_delegations: int = MANAGER_MAX_DELEGATIONS,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Let the manager delegate until it gives a final answer or runs out of budget.
+
+    Returns:
+        (final_answer, stats) - Manager's answer, and delegation counts and timings
+    """
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    # One turn at a time per agent instance, so repeated delegations do not interleave its history
+    agent_locks = {name: asyncio.Lock() for name in agent_names}
+    by_lower = {name.lower(): name for name in agent_names}
+    stats: Dict[str, Any] = {"rounds": 0, "delegations": 0, "agent_durations_ms": {}}
+    budget = max_delegations
+
+    async def run_delegation(agent_name: str, task: str) -> str:
+        async with agent_locks[agent_name], semaphore:
+            start = time.monotonic()
+            try:
+                return await delegate(agent_name, task)
+            except Exception as e:
+                logger.error(f"Agent {agent_name} failed: {e}")
+                return f"❌ Failed - {str(e)}"
+            finally:
+                elapsed_ms = (time.monotonic() - start) * 1000
+                durations = stats["agent_durations_ms"]
+                durations[agent_name] = durations.get(agent_name, 0) + elapsed_ms
+
+    message = user_task
+    for round_index in range(max_rounds):
+        reply = await manager.run(message)
+        delegations = parse_delegations(reply)
+        if not delegations:
+            return extract_final_answer(reply), stats
+
+        stats["rounds"] = round_index + 1
+        accepted, notes = [], []
+        for agent_name, task in delegations:
+            resolved = by_lower.get(agent_name.lower())
+            if resolved is None:
+                notes.append(f"- Unknown agent {agent_name}, available: {', '.join(agent_names)}")
+            elif len(accepted) >= max_per_round or budget <= 0:
+                notes.append(f"- Skipped delegation to {resolved}: delegation limit reached")
+            else:
+                accepted.append((resolved, task))
+                budget -= 1
+
+        logger.info(f"Manager round {round_index + 1}: delegating to {', '.join(name for name, _ in accepted) or 'nobody'}")
+        results = await asyncio.gather(*(run_delegation(name, task) for name, task in accepted))
+        stats["delegations"] += len(accepted)
+
+        sections = [f"### {name} (task: {task}):\n{result}" for (name, task), result in zip(accepted, results)]
+        message = "Results from your agents:\n\n" + "\n\n".join(sections or ["(no delegations were run)"])
+        if notes:
+            message += "\n\nNotes:\n" + "\n".join(notes)
+
+        if round_index + 1 >= max_rounds or budget <= 0:
+            message += "\n\nNo more delegations are allowed. Reply now with FINAL_ANSWER."
+        else:
+            message += "\n\nDelegate further tasks if needed, otherwise reply with FINAL_ANSWER."
+
+    # Delegation budget is spent, the manager must answer with what it has
+    reply = await manager.run(message)
+    return extract_final_answer(reply), stats
@@ -0,0 +1,267 @@
+"""
+Token-bucket rate limiting
+Requests/minute and tokens/minute budgets per provider and API key, and per
+user on top of that; callers wait for capacity instead of failing with 429s
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from factory.workflow_context import get_current_workflow
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PROVIDERS = ("gemini", "gmail", "calendar", "twitter")
+# Tool command -> provider whose quota it spends
+TOOL_PROVIDERS = {"send_email": "gmail", "create_calendar_event": "calendar", "post_tweet": "twitter"}
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+# Completion tokens assumed before the response reports real usage
+RATE_LIMIT_COMPLETION_ESTIMATE = int(os.getenv("RATE_LIMIT_COMPLETION_ESTIMATE", "512"))
+
+
+@dataclass(frozen=True)
+class ProviderLimits:
+    """Per-minute budgets; 0 means unlimited"""
+    rpm: float = 0
+    tpm: float = 0
+    user_rpm: float = 0
+    user_tpm: float = 0
+
+
+def load_limits(providers=RATE_LIMIT_PROVIDERS) -> Dict[str, ProviderLimits]:
+    """RATE_LIMIT_<PROVIDER>_RPM / _TPM / _USER_RPM / _USER_TPM"""
+    limits = {}
+    for provider in providers:
+        prefix = f"RATE_LIMIT_{provider.upper()}_"
+        limits[provider] = ProviderLimits(
+            rpm=float(os.getenv(prefix + "RPM", "0")),
+            tpm=float(os.getenv(prefix + "TPM", "0")),
+            user_rpm=float(os.getenv(prefix + "USER_RPM", "0")),
+            user_tpm=float(os.getenv(prefix + "USER_TPM", "0")),
+        )
+    return limits
+
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """Stable, non-reversible id for an API key (never log or expose the key itself)"""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def provider_for_model(model: str) -> str:
+    """'gemini/gemini-2.5-flash' -> 'gemini'"""
+    if "/" in model:
+        return model.split("/", 1)[0].lower()
+    return model.split("-", 1)[0].lower()
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Rough prompt size (~4 characters per token)"""
+    return sum(len(str(message.get("content") or "")) for message in messages) // 4
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Rough prompt + completion size used until real usage is known"""
+    return estimate_prompt_tokens(messages) + (max_tokens or RATE_LIMIT_COMPLETION_ESTIMATE)
+
+
+class TokenBucket:
+    """
+    Reservation-style bucket: consuming always succeeds and may drive the
+    balance negative; the caller then waits until its debt is refilled.
+    This keeps callers in arrival order without polling.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute  # Up to one minute's budget as burst
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _refill_locked(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` and return the seconds to wait before using it"""
+        with self._lock:
+            self._refill_locked()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            wait = -self.tokens / self.rate
+            self.waits += 1
+            self.wait_seconds += wait
+            return wait
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) after the fact"""
+        with self._lock:
+            self._refill_locked()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill_locked()
+            return {
+                "per_minute": self.per_minute,
+                "available": round(self.tokens, 1),
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+class Reservation:
+    """Budget taken for one call; settle() corrects the token estimate with real usage"""
+
+    def __init__(self, request_buckets: List[TokenBucket], token_buckets: List[TokenBucket], requests: int, tokens: float, wait: float):
+        self.request_buckets = request_buckets
+        self.token_buckets = token_buckets
+        self.requests = requests
+        self.tokens = tokens
+        self.wait = wait
+
+    def settle(self, actual_tokens: Optional[float]) -> None:
+        if actual_tokens is None:
+            return
+        delta = actual_tokens - self.tokens
+        for bucket in self.token_buckets:
+            bucket.adjust(delta)
+        self.tokens = actual_tokens
+
+    def cancel(self) -> None:
+        """Give everything back (the call never happened)"""
+        for bucket in self.request_buckets:
+            bucket.adjust(-self.requests)
+        for bucket in self.token_buckets:
+            bucket.adjust(-self.tokens)
+
+
+class RateLimiter:
+    """Token buckets keyed by (provider, API key) and (provider, API key, user)"""
+
+    def __init__(self, limits: Optional[Dict[str, ProviderLimits]] = None, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.limits = limits if limits is not None else load_limits()
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str, Optional[str], str], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, provider: str, fingerprint: str, user_id: Optional[str], kind: str, per_minute: float) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        key = (provider, fingerprint, user_id, kind)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(per_minute)
+                self._buckets[key] = bucket
+                # Idle buckets refill to full, so dropping the oldest loses nothing useful
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def reserve(
+        self,
+        provider: str,
+        api_key: Optional[str] = None,
+        user_id: Optional[str] = None,
+        requests: int = 1,
+        tokens: float = 0,
+    ) -> Reservation:
+        """Take budget from every applicable bucket; reservation.wait says how long to hold off"""
+        limits = self.limits.get(provider, ProviderLimits())
+        fingerprint = key_fingerprint(api_key)
+        request_buckets = [
+            bucket for bucket in (
+                self._bucket(provider, fingerprint, None, "rpm", limits.rpm),
+                self._bucket(provider, fingerprint, user_id, "rpm", limits.user_rpm) if user_id else None,
+            ) if bucket is not None
+        ]
+        token_buckets = [
+            bucket for bucket in (
+                self._bucket(provider, fingerprint, None, "tpm", limits.tpm),
+                self._bucket(provider, fingerprint, user_id, "tpm", limits.user_tpm) if user_id else None,
+            ) if bucket is not None
+        ]
+
+        wait = 0.0
+        for bucket in request_buckets:
+            wait = max(wait, bucket.reserve(requests))
+        if tokens:
+            for bucket in token_buckets:
+                wait = max(wait, bucket.reserve(tokens))
+        return Reservation(request_buckets, token_buckets, requests, tokens, wait)
+
+    async def acquire(self, provider: str, api_key: Optional[str] = None, user_id: Optional[str] = None, requests: int = 1, tokens: float = 0) -> Reservation:
+        """Wait (without blocking the loop) until the budget is available"""
+        reservation = self.reserve(provider, api_key, user_id, requests, tokens)
+        if reservation.wait > 0:
+            self._record_wait(provider, reservation.wait)
+            try:
+                await asyncio.sleep(reservation.wait)
+            except asyncio.CancelledError:
+                reservation.cancel()
+                raise
+        return reservation
+
+    def acquire_blocking(self, provider: str, api_key: Optional[str] = None, user_id: Optional[str] = None, requests: int = 1, tokens: float = 0) -> Reservation:
+        """acquire() for worker threads"""
+        reservation = self.reserve(provider, api_key, user_id, requests, tokens)
+        if reservation.wait > 0:
+            self._record_wait(provider, reservation.wait)
+            time.sleep(reservation.wait)
+        return reservation
+
+    @staticmethod
+    def _record_wait(provider: str, wait: float) -> None:
+        if wait > 1:
+            logger.info(f"⏳ Rate limit: waiting {wait:.2f}s for {provider} capacity")
+        workflow = get_current_workflow()
+        if workflow is not None:
+            workflow.record("rate_limit", f"{provider}_waits")
+            workflow.record_timing(f"rate_limit_wait_{provider}", wait * 1000)
+
+    def snapshot(self, max_buckets: int = 100) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._buckets.items())[-max_buckets:]
+            total = len(self._buckets)
+        return {
+            "limits": {
+                provider: vars(limits) for provider, limits in self.limits.items()
+                if any(vars(limits).values())
+            },
+            "bucket_count": total,
+            "buckets": [
+                {"provider": provider, "api_key": fingerprint, "user_id": user_id, "kind": kind, **bucket.snapshot()}
+                for (provider, fingerprint, user_id, kind), bucket in reversed(recent)
+            ],
+        }
+
+
+# Global instance
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or create the process-wide rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
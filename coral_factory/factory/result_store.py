@@ -0,0 +1,234 @@
+"""
+Bounded workflow result store
+Keeps running workflows until they finish and then a compact record of each
+result for a TTL, within an entry cap and a memory budget
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+from factory.runner import WorkflowRunner
+from factory.workflow_events import WorkflowEventBus
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_TTL_SECONDS = float(os.getenv("RESULT_STORE_TTL_SECONDS", "3600"))
+RESULT_STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "10000"))
+RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Expired records are swept at most this often (lookups also drop them)
+RESULT_STORE_SWEEP_INTERVAL_SECONDS = float(os.getenv("RESULT_STORE_SWEEP_INTERVAL_SECONDS", "30"))
+
+
+def _approx_bytes(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode())
+    return len(json.dumps(value, default=str))
+
+
+@dataclass
+class WorkflowRecord:
+    """
+    What is kept of a finished workflow: its outcome, counters and (while
+    memory allows) the event log for stream replay. Config, API key and agents
+    are dropped with the runner.
+    """
+    trace_id: str
+    user_id: str
+    status: str
+    result: Any
+    queue_wait_ms: float
+    run_ms: Optional[float]
+    stats: Dict[str, Dict[str, int]]
+    timings_ms: Dict[str, float]
+    events: Any
+    finished_at: float
+    result_bytes: int = 0
+    events_bytes: int = 0
+
+    @classmethod
+    def from_runner(cls, runner: WorkflowRunner) -> "WorkflowRecord":
+        record = cls(
+            trace_id=runner.trace_id,
+            user_id=runner.user_id,
+            status=runner.status,
+            result=runner.result,
+            queue_wait_ms=runner.queue_wait_ms,
+            run_ms=runner.run_ms,
+            stats=runner.stats,
+            timings_ms=runner.timings_ms,
+            events=runner.events,
+            finished_at=time.monotonic(),
+        )
+        record.result_bytes = _approx_bytes(record.result) + _approx_bytes(record.stats) + 256
+        record.events_bytes = runner.events.approx_bytes()
+        return record
+
+    @property
+    def size_bytes(self) -> int:
+        return self.result_bytes + self.events_bytes
+
+    async def wait(self, timeout: float) -> bool:
+        """Same interface as WorkflowRunner.wait; a record is always finished"""
+        return True
+
+    def event_log(self) -> WorkflowEventBus:
+        """The recorded events, or just the final workflow_end once they were dropped for memory"""
+        if self.events is not None:
+            return self.events
+        summary = WorkflowEventBus(self.trace_id)
+        summary.publish("workflow_end", status=self.status, run_ms=self.run_ms, result=self.result)
+        summary.close()
+        return summary
+
+
+class ResultStore:
+    """
+    Running workflows by trace_id, replaced by a WorkflowRecord when they finish.
+
+    Finished records are kept in least-recently-read order. Reads are
+    idempotent: a result can be fetched any number of times until it
+    expires. Records are dropped after `ttl_seconds`. Over `max_bytes`,
+    event logs of the least recently read records are dropped first
+    (results stay readable), then whole records. Over `max_entries`,
+    whole records are dropped. Running workflows are never evicted; the
+    scheduler's queue already bounds them.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = RESULT_STORE_TTL_SECONDS,
+        max_entries: int = RESULT_STORE_MAX_ENTRIES,
+        max_bytes: int = RESULT_STORE_MAX_BYTES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._active: Dict[str, WorkflowRunner] = {}
+        self._finished: "OrderedDict[str, WorkflowRecord]" = OrderedDict()
+        self._bytes = 0
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {
+            "reads": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted_for_size": 0,
+            "evicted_for_count": 0,
+            "event_logs_dropped": 0,
+        }
+
+    def add(self, runner: WorkflowRunner) -> None:
+        with self._lock:
+            self._active[runner.trace_id] = runner
+        runner.add_finish_callback(self.complete)
+
+    def discard(self, trace_id: str) -> None:
+        """Forget a workflow (e.g. one the scheduler refused)"""
+        with self._lock:
+            self._active.pop(trace_id, None)
+            record = self._finished.pop(trace_id, None)
+            if record is not None:
+                self._bytes -= record.size_bytes
+
+    def complete(self, runner: WorkflowRunner) -> None:
+        """Swap a finished runner for its compact record"""
+        record = WorkflowRecord.from_runner(runner)
+        with self._lock:
+            self._active.pop(runner.trace_id, None)
+            previous = self._finished.pop(runner.trace_id, None)
+            if previous is not None:
+                self._bytes -= previous.size_bytes
+            self._finished[runner.trace_id] = record
+            self._bytes += record.size_bytes
+            self._sweep_locked(force=False)
+            self._evict_locked()
+
+    def get(self, trace_id: str) -> Optional[Union[WorkflowRunner, WorkflowRecord]]:
+        """The running workflow or its finished record; reading does not remove it"""
+        with self._lock:
+            self._stats["reads"] += 1
+            runner = self._active.get(trace_id)
+            if runner is not None:
+                return runner
+            record = self._finished.get(trace_id)
+            if record is None:
+                self._stats["misses"] += 1
+                return None
+            if self._expired(record, time.monotonic()):
+                self._remove_locked(trace_id)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._finished.move_to_end(trace_id)
+            return record
+
+    def __contains__(self, trace_id: str) -> bool:
+        return self.get(trace_id) is not None
+
+    def _expired(self, record: WorkflowRecord, now: float) -> bool:
+        return now - record.finished_at > self.ttl_seconds
+
+    def _remove_locked(self, trace_id: str) -> None:
+        record = self._finished.pop(trace_id)
+        self._bytes -= record.size_bytes
+
+    def _sweep_locked(self, force: bool) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_sweep < RESULT_STORE_SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        for trace_id in [trace_id for trace_id, record in self._finished.items() if self._expired(record, now)]:
+            self._remove_locked(trace_id)
+            self._stats["expired"] += 1
+
+    def _evict_locked(self) -> None:
+        if self._bytes > self.max_bytes:
+            # Cheap first: event logs (token streams) are usually most of a record
+            for record in self._finished.values():
+                if self._bytes <= self.max_bytes:
+                    break
+                if record.events is not None:
+                    self._bytes -= record.events_bytes
+                    record.events = None
+                    record.events_bytes = 0
+                    self._stats["event_logs_dropped"] += 1
+
+        while self._finished and (self._bytes > self.max_bytes or len(self._finished) > self.max_entries):
+            reason = "evicted_for_size" if self._bytes > self.max_bytes else "evicted_for_count"
+            trace_id = next(iter(self._finished))
+            self._remove_locked(trace_id)
+            self._stats[reason] += 1
+            logger.debug(f"Result store evicted {trace_id} ({reason})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._sweep_locked(force=True)
+            return {
+                **self._stats,
+                "running": len(self._active),
+                "finished": len(self._finished),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+# Global instance
+_result_store: Optional[ResultStore] = None
+_result_store_lock = threading.Lock()
+
+def get_result_store() -> ResultStore:
+    """Get or create the process-wide workflow result store"""
+    global _result_store
+    if _result_store is None:
+        with _result_store_lock:
+            if _result_store is None:
+                _result_store = ResultStore()
+    return _result_store
@@ -0,0 +1,144 @@
+"""
+Triage router
+Picks which agent(s) should handle a task with one short LLM call,
+falling back to a local keyword classifier
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from factory.llm import acomplete
+from factory.workflow_context import get_current_workflow
+
+logger = logging.getLogger(__name__)
+
+TRIAGE_MAX_AGENTS = int(os.getenv("TRIAGE_MAX_AGENTS", "2"))
+TRIAGE_ROUTER = os.getenv("TRIAGE_ROUTER", "llm")  # "llm" or "heuristic"
+# Thinking models count reasoning tokens against max_tokens, so leave room beyond the short JSON reply
+TRIAGE_ROUTER_MAX_TOKENS = int(os.getenv("TRIAGE_ROUTER_MAX_TOKENS", "1024"))
+
+ROUTER_PROMPT = """You are a triage router. Choose which agent(s) should handle the user's task.
+
+Available agents (name: persona):
+{roster}
+Rules:
+- Pick the single best agent whenever one agent can handle the task
+- Pick more than one agent only if the task clearly needs several of them, at most {max_agents}
+- Use the exact agent names listed above
+- Reply with JSON only, no prose: {{"agents": ["AgentName"]}}
+"""
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "to", "of", "for", "in", "on", "with", "by", "is", "are",
+    "you", "your", "me", "my", "i", "it", "this", "that", "as", "at", "be", "from", "who",
+    "what", "please", "can", "will", "agent", "about", "all", "into",
+}
+
+
+def _tokens(text: str) -> set:
+    return {word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS and len(word) > 2}
+
+
+def heuristic_route(user_task: str, personas: Dict[str, str], max_agents: int) -> List[str]:
+    """Score agents by word overlap between the task and their name and persona"""
+    task_tokens = _tokens(user_task)
+    scores = []
+    for index, (name, persona) in enumerate(personas.items()):
+        agent_tokens = _tokens(f"{name} {persona}")
+        scores.append((len(task_tokens & agent_tokens), -index, name))
+
+    scores.sort(reverse=True)
+    best_score = scores[0][0] if scores else 0
+    if best_score == 0:
+        # Nothing matched, the first agent is the workflow's default entry point
+        return list(personas)[:1]
+
+    # Keep agents that score close to the best one
+    selected = [name for score, _, name in scores if score > 0 and score * 2 >= best_score][:max_agents]
+    return [name for name in personas if name in selected]
+
+
+def _parse_router_reply(reply: str, names: List[str], max_agents: int) -> List[str]:
+    match = re.search(r"\{.*\}", reply or "", re.DOTALL)
+    if not match:
+        return []
+    try:
+        chosen = json.loads(match.group(0)).get("agents") or []
+    except (json.JSONDecodeError, AttributeError):
+        return []
+
+    by_lower = {name.lower(): name for name in names}
+    selected = []
+    for name in chosen:
+        resolved = by_lower.get(str(name).strip().lower())
+        if resolved and resolved not in selected:
+            selected.append(resolved)
+    return selected[:max_agents]
+
+
+def _router_completion_kwargs(model: str) -> Dict[str, object]:
+    """Completion options for the router call; thinking is switched off where the model allows it"""
+    kwargs: Dict[str, object] = {"max_tokens": TRIAGE_ROUTER_MAX_TOKENS}
+    # Gemini 2.5 Flash / Flash-Lite accept a zero thinking budget (2.5 Pro does not)
+    if "gemini-2.5-flash" in model.lower():
+        kwargs["thinking"] = {"type": "enabled", "budget_tokens": 0}
+    return kwargs
+
+
+def _record_route(router: str, fallback: bool = False) -> None:
+    workflow = get_current_workflow()
+    if workflow is not None:
+        workflow.record("router", router)
+        if fallback:
+            workflow.record("router", "llm_fallbacks")
+
+
+async def route_task(
+    user_task: str,
+    personas: Dict[str, str],
+    model: str,
+    api_key: Optional[str] = None,
+    max_agents: int = TRIAGE_MAX_AGENTS,
+    mode: str = TRIAGE_ROUTER,
+) -> Tuple[List[str], str]:
+    """
+    Pick the agent(s) that should handle the task.
+
+    Returns:
+        (agent_names, router) - Selected agents in workflow order, and "llm" or "heuristic"
+    """
+    names = list(personas)
+    max_agents = max(1, max_agents)
+    if len(names) <= 1:
+        _record_route("heuristic")
+        return names, "heuristic"
+
+    if mode == "llm":
+        roster = "".join(f"{name}: {persona}\n" for name, persona in personas.items())
+        try:
+            reply = await acomplete(
+                model=model,
+                messages=[
+                    {"role": "system", "content": ROUTER_PROMPT.format(roster=roster, max_agents=max_agents)},
+                    {"role": "user", "content": user_task},
+                ],
+                temperature=0,
+                api_key=api_key,
+                **_router_completion_kwargs(model),
+            )
+            selected = _parse_router_reply(reply, names, max_agents)
+            if selected:
+                _record_route("llm")
+                return [name for name in names if name in selected], "llm"
+            logger.warning(f"Router reply did not name a known agent, using heuristic: {(reply or '')[:100]!r}")
+        except Exception as e:
+            logger.error(f"Router call failed, using heuristic: {e}")
+        _record_route("heuristic", fallback=True)
+        return heuristic_route(user_task, personas, max_agents), "heuristic"
+
+    _record_route("heuristic")
+    return heuristic_route(user_task, personas, max_agents), "heuristic"
@@ -1,43 +1,123 @@
 import asyncio
-from threading import Thread
+import time
 from factory.builder import WorkflowConfig
 from factory.builder import start_agents
+from factory.workflow_context import WorkflowContext, current_workflow
+from factory.webhooks import get_webhook_dispatcher
+from factory.workflow_events import WorkflowEventBus
 
 import logging
 logger = logging.getLogger(__name__)
 
-class WorkflowRunner(Thread):
-    def __init__(self, workflow_config: WorkflowConfig, user_id: str, user_task: str, trace_id: str):
-        super().__init__()
+class WorkflowRunner:
+    def __init__(self, workflow_config: WorkflowConfig, user_id: str, user_task: str, trace_id: str, callback_url: str = None):
         self.workflow_config = workflow_config
         self.trace_id = trace_id
         self.user_id = user_id
         self.user_task = user_task
+        self.callback_url = callback_url
         self.status = "pending"
         self.result = None
+        self.events = WorkflowEventBus(trace_id)
+        # Set once the workflow completed or failed, for long-polling clients
+        self.done = asyncio.Event()
+        self._finish_callbacks = []
+        self.context = WorkflowContext(
+            trace_id=trace_id,
+            user_id=user_id,
+            cache_completions=workflow_config.cache_completions,
+            events=self.events,
+        )
 
-    def run(self):
+        # Scheduling timestamps (monotonic seconds)
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def stats(self):
+        return self.context.stats
+
+    @property
+    def timings_ms(self):
+        return self.context.timings_ms
+
+    @property
+    def queue_wait_ms(self):
+        end = self.started_at or time.monotonic()
+        return round((end - self.enqueued_at) * 1000, 2)
+
+    @property
+    def run_ms(self):
+        if self.started_at is None:
+            return None
+        end = self.finished_at or time.monotonic()
+        return round((end - self.started_at) * 1000, 2)
+
+    def add_finish_callback(self, callback) -> None:
+        """Call `callback(runner)` once the workflow has finished"""
+        self._finish_callbacks.append(callback)
+
+    def finish(self, status: str, result) -> None:
+        """Record the final state and wake everyone waiting for it; only the first call counts"""
+        if self.done.is_set():
+            return
+        self.status = status
+        self.result = result
+        self.events.publish("workflow_end", status=status, run_ms=self.run_ms, result=result)
+        self.events.close()
+        self.done.set()
+        if self.callback_url:
+            get_webhook_dispatcher().enqueue(self.callback_url, self.webhook_payload(), delivery_id=self.trace_id)
+        for callback in self._finish_callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Finish callback failed for {self.trace_id}: {e}")
+
+    def webhook_payload(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "result": self.result,
+            "queue_wait_ms": self.queue_wait_ms,
+            "run_ms": self.run_ms,
+            "stats": self.context.stats,
+        }
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the workflow to finish; True if it did"""
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.done.is_set()
+
+    async def run(self):
         logger.info(f"Running workflow {self.trace_id}")
         self.status = "running"
+        self.started_at = time.monotonic()
+        context_token = current_workflow.set(self.context)
+        self.events.publish("workflow_start", trace_id=self.trace_id, queue_wait_ms=self.queue_wait_ms)
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            # Run async func
-            out = loop.run_until_complete(
-                start_agents(
-                    self.workflow_config, 
-                    user_task=self.user_task, 
-                    user_id=self.user_id
-                )
+            out = await start_agents(
+                self.workflow_config,
+                user_task=self.user_task,
+                user_id=self.user_id
             )
-            loop.close()
+            status, result = "completed", out
+            logger.info(f"Workflow {self.trace_id} completed")
+            return out
         except Exception as e:
             logger.error(f"Workflow {self.trace_id} failed: {e}")
-            self.status = "failed"
-            self.result = str(e)
+            status, result = "failed", str(e)
             return
-        self.result = out
-        self.status = "completed"
-        logger.info(f"Workflow {self.trace_id} completed")
-        return out
\ No newline at end of file
+        except BaseException:
+            # Cancelled (e.g. shutdown) before finishing
+            status, result = "failed", "Workflow cancelled"
+            raise
+        finally:
+            current_workflow.reset(context_token)
+            self.finished_at = time.monotonic()
+            self.finish(status, result)
@@ -0,0 +1,130 @@
+"""
+Bounded workflow scheduler
+Runs workflows as tasks on a fixed pool of async workers behind an admission queue
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from factory.runner import WorkflowRunner
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_MAX_CONCURRENCY = int(os.getenv("WORKFLOW_MAX_CONCURRENCY", "64"))
+WORKFLOW_QUEUE_SIZE = int(os.getenv("WORKFLOW_QUEUE_SIZE", "256"))
+
+
+class WorkflowScheduler:
+    """Fixed pool of workers pulling WorkflowRunners from a bounded queue"""
+
+    def __init__(self, max_concurrency: int = WORKFLOW_MAX_CONCURRENCY, queue_size: int = WORKFLOW_QUEUE_SIZE):
+        if max_concurrency < 1 or queue_size < 1:
+            raise ValueError("max_concurrency and queue_size must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._busy = 0
+        self._started_at = time.monotonic()
+
+        # Stats
+        self._submitted = 0
+        self._rejected = 0
+        self._finished = 0
+        self._total_wait_s = 0.0
+        self._max_wait_s = 0.0
+        self._total_run_s = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Create the queue and worker tasks on the running event loop"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._started_at = time.monotonic()
+        self._workers = [
+            asyncio.create_task(self._worker(index), name=f"workflow-worker-{index}")
+            for index in range(self.max_concurrency)
+        ]
+        logger.info(f"Workflow scheduler started ({self.max_concurrency} workers, queue size {self.queue_size})")
+
+    async def stop(self) -> None:
+        """Cancel all workers; queued workflows are marked as failed"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        while self._queue is not None and not self._queue.empty():
+            runner = self._queue.get_nowait()
+            runner.finish("failed", "Server shutting down")
+        logger.info("Workflow scheduler stopped")
+
+    def submit(self, runner: WorkflowRunner) -> bool:
+        """Admit a workflow; returns False when the queue is full"""
+        if self._queue is None:
+            raise RuntimeError("Workflow scheduler is not started")
+        try:
+            self._queue.put_nowait(runner)
+        except asyncio.QueueFull:
+            self._rejected += 1
+            logger.warning(f"Workflow queue full ({self.queue_size}), rejecting {runner.trace_id}")
+            return False
+        self._submitted += 1
+        return True
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a queue slot frees up"""
+        avg_run_s = self._total_run_s / self._finished if self._finished else 5.0
+        return max(1, math.ceil(avg_run_s / self.max_concurrency * max(self.queue_depth, 1)))
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            runner = await self._queue.get()
+            self._busy += 1
+            try:
+                wait_s = time.monotonic() - runner.enqueued_at
+                self._total_wait_s += wait_s
+                self._max_wait_s = max(self._max_wait_s, wait_s)
+                await runner.run()
+            except asyncio.CancelledError:
+                # No-op when run() already recorded its terminal state
+                runner.finish("failed", "Workflow cancelled")
+                raise
+            except Exception as e:
+                logger.error(f"Worker {index} crashed running {runner.trace_id}: {e}")
+                runner.finish("failed", str(e))
+            finally:
+                self._busy -= 1
+                self._finished += 1
+                if runner.run_ms is not None:
+                    self._total_run_s += runner.run_ms / 1000
+                self._queue.task_done()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, wait time and worker utilization"""
+        dequeued = max(self._finished + self._busy, 1)
+        return {
+            "workers": self.max_concurrency,
+            "busy_workers": self._busy,
+            "utilization": round(self._busy / self.max_concurrency, 3),
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self.queue_size,
+            "submitted": self._submitted,
+            "rejected": self._rejected,
+            "finished": self._finished,
+            "avg_wait_ms": round(self._total_wait_s * 1000 / dequeued, 2),
+            "max_wait_ms": round(self._max_wait_s * 1000, 2),
+            "avg_run_ms": round(self._total_run_s * 1000 / max(self._finished, 1), 2),
+        }
@@ -3,16 +3,21 @@ Simple agent implementation using LiteLLM directly
 Replaces openai-agents SDK which has compatibility issues with Gemini
 """
 
-import litellm
+import asyncio
 import os
 import logging
 from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
 from datetime import datetime
+import time
 import json
 import uuid
 
+from factory.llm import LLM_STREAMING, acomplete
 from factory.tools import get_tool_executor
-from factory.tool_parser import ToolCommandParser
+from factory.tool_parser import TOOL_EARLY_DISPATCH, ToolCommandParser
+from factory.workflow_context import get_current_workflow
+from factory.workflow_events import emit
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +35,8 @@ class SimpleLiteLLMAgent:
         temperature: float = 0.7,
         tracer = None,
         user_id: str = None,
-        enable_tools: bool = True
+        enable_tools: bool = True,
+        tool_parser: Optional[ToolCommandParser] = None
     ):
         self.name = name
         self.model = model  # e.g., "gemini/gemini-2.5-flash"
@@ -43,10 +49,9 @@ class SimpleLiteLLMAgent:
         self.user_id = user_id
         self.enable_tools = enable_tools
         
-        # Initialize tool parser
+        # Initialize tool parser (compiled agents share theirs; it holds no per-run state)
         if self.enable_tools:
-            tool_executor = get_tool_executor()
-            self.tool_parser = ToolCommandParser(tool_executor)
+            self.tool_parser = tool_parser or ToolCommandParser(get_tool_executor())
             logger.info(f"✅ Tool parser enabled for {name}")
         else:
             self.tool_parser = None
@@ -62,6 +67,7 @@ class SimpleLiteLLMAgent:
         span_id = str(uuid.uuid4())
         start_time = datetime.now()
         
+        emit("agent_start", agent=self.name, model=self.model, input=user_message[:500])
         try:
             logger.info(f"Agent {self.name} processing message: {user_message[:100]}...")
             
@@ -81,21 +87,31 @@ class SimpleLiteLLMAgent:
             # Add current user message
             messages.append({"role": "user", "content": user_message})
             
-            # Call LiteLLM
-            response = litellm.completion(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                timeout=60
-            )
+            # With TOOL_EARLY_DISPATCH, tool commands start from the token stream while the model is still generating
+            early_dispatch = self.tool_parser and LLM_STREAMING and TOOL_EARLY_DISPATCH
+            stream_parser = self.tool_parser.streaming() if early_dispatch else None
             
-            # Extract response
-            assistant_message = response.choices[0].message.content
+            # Call LiteLLM without blocking the event loop, streaming tokens to subscribers
+            try:
+                assistant_message = await acomplete(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    api_key=self.api_key,
+                    on_token=self._token_callback(stream_parser),
+                )
+            except BaseException:
+                if stream_parser:
+                    stream_parser.abandon()
+                raise
             
-            # Parse and execute any tool commands
+            # Parse and execute any tool commands (run concurrently on the tool pool)
             if self.tool_parser:
                 logger.info(f"🔧 Parsing output for tool commands...")
-                modified_message, tool_results = self.tool_parser.parse_and_execute(assistant_message)
+                if stream_parser:
+                    modified_message, tool_results = await stream_parser.finish()
+                else:
+                    modified_message, tool_results = await self.tool_parser.aparse_and_execute(assistant_message)
                 
                 if tool_results:
                     logger.info(f"✅ Executed {len(tool_results)} tools")
@@ -115,10 +131,14 @@ class SimpleLiteLLMAgent:
                 await self._save_trace_end(trace_id, span_id, assistant_message, start_time, end_time, "completed")
             
             logger.info(f"Agent {self.name} completed successfully")
+            emit("agent_end", agent=self.name, status="completed", output=assistant_message,
+                 duration_ms=round((datetime.now() - start_time).total_seconds() * 1000, 1))
             return assistant_message
             
         except Exception as e:
             logger.error(f"Agent {self.name} failed: {e}")
+            emit("agent_end", agent=self.name, status="failed", error=str(e),
+                 duration_ms=round((datetime.now() - start_time).total_seconds() * 1000, 1))
             
             # Save trace failure to Firebase
             if self.tracer and self.user_id:
@@ -127,6 +147,23 @@ class SimpleLiteLLMAgent:
             
             raise
     
+    def _token_callback(self, stream_parser=None):
+        """
+        Per-token callback feeding the streaming tool parser and publishing token
+        events, or None (no streaming) when neither is needed
+        """
+        workflow = get_current_workflow()
+        publish = LLM_STREAMING and workflow is not None and workflow.events is not None
+        if not publish and stream_parser is None:
+            return None
+        
+        def on_token(text: str) -> None:
+            if publish:
+                emit("token", agent=self.name, text=text)
+            if stream_parser is not None:
+                stream_parser.feed(text)
+        return on_token
+    
     async def _save_trace_start(self, trace_id: str, span_id: str, user_message: str, start_time: datetime):
         """Save trace start to Firebase"""
         try:
@@ -141,7 +178,7 @@ class SimpleLiteLLMAgent:
                     "status": "running",
                     "start_time": start_time.isoformat(),
                     "input": user_message,
-                })
+                }, user_id=self.user_id)
                 
                 # Save span
                 await trace_processor.save_span({
@@ -152,7 +189,7 @@ class SimpleLiteLLMAgent:
                     "status": "running",
                     "start_time": start_time.isoformat(),
                     "input": user_message,
-                })
+                }, user_id=self.user_id)
                 
                 logger.info(f"Saved trace start: {trace_id}")
         except Exception as e:
@@ -176,7 +213,7 @@ class SimpleLiteLLMAgent:
                     "duration_ms": duration_ms,
                     "input": self.conversation_history[-2]["content"] if len(self.conversation_history) >= 2 else "",
                     "output": output,
-                })
+                }, user_id=self.user_id)
                 
                 # Update span
                 await trace_processor.save_span({
@@ -189,35 +226,67 @@ class SimpleLiteLLMAgent:
                     "end_time": end_time.isoformat(),
                     "duration_ms": duration_ms,
                     "output": output,
-                })
+                }, user_id=self.user_id)
                 
                 logger.info(f"Saved trace end: {trace_id} (status: {status})")
         except Exception as e:
             logger.error(f"Failed to save trace end: {e}")
 
 
-async def build_simple_agent(
+@dataclass(frozen=True)
+class CompiledAgent:
+    """Run-independent part of an agent: model, tool parser and system prompt minus the context"""
+    name: str
+    model: str
+    prompt_prefix: str
+    enable_tools: bool
+    temperature: float = 0.7
+    tool_parser: Optional[ToolCommandParser] = field(default=None, compare=False, repr=False)
+
+    def instantiate(
+        self,
+        api_key: str,
+        user_id: str,
+        context: Dict[str, Any] = {},
+        tracer: List[Any] = None,
+        date_only: bool = False
+    ) -> SimpleLiteLLMAgent:
+        """
+        Create a fresh agent for one run, with its own conversation history.
+        With `date_only` the prompt carries today's date instead of the time, so
+        identical runs on the same day send identical prompts (completion cache).
+        """
+        if date_only:
+            context_string = f"- The date is: {time.strftime('%a %b %d %Y')}\n"
+        else:
+            context_string = f"- The time is: {time.asctime()}\n"
+        context_string += (context.get("__system__") or "")
+
+        return SimpleLiteLLMAgent(
+            name=self.name,
+            model=self.model,
+            instructions=f"{self.prompt_prefix}{context_string}\n",
+            api_key=api_key,
+            temperature=self.temperature,
+            tracer=tracer,
+            user_id=user_id,
+            enable_tools=self.enable_tools,
+            tool_parser=self.tool_parser
+        )
+
+
+def compile_simple_agent(
     agent_name: str,
-    user_id: str,
     model_name: str,
-    mcp_servers: List[Dict[str, Any]],
     toolkits: List[str],
-    api_key: str,
     persona: str,
     output: str,
     guidelines: str,
-    context: Dict[str, Any] = {},
-    tracer: List[Any] = None
-) -> SimpleLiteLLMAgent:
-    """Build a simple LiteLLM agent (compatible with old interface)"""
+) -> CompiledAgent:
+    """Assemble everything about an agent that does not change between runs"""
     
-    import time
     from factory.tool_parser import enhance_agent_prompt_with_tools
     
-    # Build system prompt
-    context_string = f"- The time is: {time.asctime()}\n"
-    context_string += (context.get("__system__") or "")
-    
     if len(guidelines) > 0:
         guidelines_string = "- " + "\n- ".join(guidelines) if isinstance(guidelines, list) else guidelines
     else:
@@ -297,26 +366,38 @@ Expected output format:
 {output}
 
 Context:
-{context_string}
 """
     
     # Transform model name for LiteLLM
     if "gemini" in model_name.lower() and not model_name.startswith("gemini/"):
         model_name = f"gemini/{model_name}"
     
-    logger.info(f"Building simple agent: {agent_name} with model: {model_name} (tools: {enable_tools})")
+    logger.info(f"Compiled simple agent: {agent_name} with model: {model_name} (tools: {enable_tools})")
     
-    # Create simple agent with tracer and tools
-    agent = SimpleLiteLLMAgent(
+    return CompiledAgent(
         name=agent_name,
         model=model_name,
-        instructions=system_prompt,
-        api_key=api_key,
+        prompt_prefix=system_prompt,
+        enable_tools=enable_tools,
         temperature=0.7,
-        tracer=tracer,
-        user_id=user_id,
-        enable_tools=enable_tools
+        tool_parser=ToolCommandParser(get_tool_executor()) if enable_tools else None
     )
-    
-    return agent
+
+
+async def build_simple_agent(
+    agent_name: str,
+    user_id: str,
+    model_name: str,
+    mcp_servers: List[Dict[str, Any]],
+    toolkits: List[str],
+    api_key: str,
+    persona: str,
+    output: str,
+    guidelines: str,
+    context: Dict[str, Any] = {},
+    tracer: List[Any] = None
+) -> SimpleLiteLLMAgent:
+    """Build a simple LiteLLM agent (compatible with old interface)"""
+    compiled = compile_simple_agent(agent_name, model_name, toolkits, persona, output, guidelines)
+    return compiled.instantiate(api_key=api_key, user_id=user_id, context=context, tracer=tracer)
 
@@ -0,0 +1,137 @@
+"""
+Idempotency for side-effecting tool commands
+Remembers the result of each (workflow trace_id, tool, normalized params) for a
+bounded time, so a repeated or re-run command returns the earlier result instead
+of sending the email or tweet again
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOOL_IDEMPOTENCY_ENABLED = os.getenv("TOOL_IDEMPOTENCY_ENABLED", "true").lower() == "true"
+TOOL_IDEMPOTENCY_TTL_SECONDS = float(os.getenv("TOOL_IDEMPOTENCY_TTL_SECONDS", "3600"))
+TOOL_IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("TOOL_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+_WHITESPACE = re.compile(r"\s+")
+# Parameters compared case-insensitively (addresses)
+_CASE_INSENSITIVE_PARAMS = ("to",)
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Collapse whitespace and case differences that do not change what the tool does"""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = _WHITESPACE.sub(" ", value).strip()
+            if name in _CASE_INSENSITIVE_PARAMS:
+                value = value.casefold()
+        normalized[name] = value
+    return normalized
+
+
+def idempotency_key(trace_id: str, tool: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps([trace_id, tool, normalize_params(params)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Bounded TTL map from idempotency key to tool result.
+
+    claim() makes the first caller of a key its owner; later callers get the
+    stored result or, while the owner is still running, a future for it.
+    Failed results are not stored, so a retry can run the command again.
+    """
+
+    def __init__(self, ttl_seconds: float = TOOL_IDEMPOTENCY_TTL_SECONDS, max_entries: int = TOOL_IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"claims": 0, "hits": 0, "joined": 0, "stored": 0, "evicted": 0, "expired": 0}
+
+    def claim(self, key: str) -> Tuple[str, Any]:
+        """
+        Returns one of:
+            ("hit", result)    - already executed within the TTL
+            ("wait", future)   - being executed by another caller right now
+            ("owner", None)    - caller must execute and then complete() or abandon()
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._stats["claims"] += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return "hit", result
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._stats["joined"] += 1
+                return "wait", pending
+
+            self._pending[key] = Future()
+            return "owner", None
+
+    def complete(self, key: str, result: str) -> None:
+        """Publish the owner's result; only successful results are remembered"""
+        with self._lock:
+            future = self._pending.pop(key, None)
+            if not result.startswith("❌"):
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+                self._entries.move_to_end(key)
+                self._stats["stored"] += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evicted"] += 1
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def abandon(self, key: str, error: BaseException) -> None:
+        """Owner failed without a result; waiters see the error and nothing is stored"""
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "in_flight": len(self._pending),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+# Global instance
+_idempotency_store: Optional[IdempotencyStore] = None
+_idempotency_store_lock = threading.Lock()
+
+def get_idempotency_store() -> Optional[IdempotencyStore]:
+    """Process-wide idempotency store, or None when disabled"""
+    global _idempotency_store
+    if not TOOL_IDEMPOTENCY_ENABLED:
+        return None
+    if _idempotency_store is None:
+        with _idempotency_store_lock:
+            if _idempotency_store is None:
+                _idempotency_store = IdempotencyStore()
+    return _idempotency_store
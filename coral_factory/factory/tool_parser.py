@@ -4,22 +4,298 @@ Handles structured output from agents and executes tools
 """
 
 import re
+import asyncio
+import contextvars
 import logging
+import os
+from dataclasses import dataclass
 from typing import Dict, Any, Optional, Tuple, List
 
+from factory.tool_idempotency import IdempotencyStore, get_idempotency_store, idempotency_key
+from factory.rate_limit import TOOL_PROVIDERS, get_rate_limiter
+from factory.tool_pool import ToolExecutionPool, get_tool_pool
+from factory.workflow_context import get_current_workflow
+from factory.workflow_events import emit
+
 logger = logging.getLogger(__name__)
 
+# Start tool commands while the LLM is still streaming. Off by default: if the
+# stream then fails or is retried, emails/events/tweets already went out and a
+# regenerated answer can send them again with different content.
+TOOL_EARLY_DISPATCH = os.getenv("TOOL_EARLY_DISPATCH", "false").lower() == "true"
+
+
+@dataclass(frozen=True)
+class ToolCommand:
+    """One tool command found in agent output, with its span in that output"""
+    tool: str
+    params: Dict[str, str]
+    start: int
+    end: int
+
 
 class ToolCommandParser:
     """Parses agent output for tool commands and executes them"""
     
+    # A single-line field; it also stops at the next command keyword, so a malformed
+    # command fails within its own text instead of running to the end of the output
+    _FIELD = r'(?:(?!SEND_EMAIL:|CREATE_EVENT:|POST_TWEET:)[^|\n])+'
+    
     # Command patterns
-    EMAIL_PATTERN = r'SEND_EMAIL:\s*to=([^|]+)\|\s*subject=([^|]+)\|\s*body=(.+?)(?=\n[A-Z_]+:|$)'
-    CALENDAR_PATTERN = r'CREATE_EVENT:\s*title=([^|]+)\|\s*date=([^|]+)\|\s*time=([^|]+)'
-    TWEET_PATTERN = r'POST_TWEET:\s*text=(.+?)(?=\n[A-Z_]+:|$)'
+    EMAIL_PATTERN = rf'SEND_EMAIL:\s*to=(?P<email_to>{_FIELD})\|\s*subject=(?P<email_subject>{_FIELD})\|\s*body=(?P<email_body>.+?)(?=\n[A-Z_]+:|$)'
+    CALENDAR_PATTERN = rf'CREATE_EVENT:\s*title=(?P<event_title>{_FIELD})\|\s*date=(?P<event_date>{_FIELD})\|\s*time=(?P<event_time>{_FIELD})'
+    TWEET_PATTERN = r'POST_TWEET:\s*text=(?P<tweet_text>.+?)(?=\n[A-Z_]+:|$)'
+    
+    # All commands in one alternation, matched only where a command keyword starts.
+    # Every attempt ends by the next keyword or line end (bounded fields) or
+    # consumes the text it covers (bodies), so the scan stays linear in the output
+    COMMAND_PATTERN = re.compile(
+        f'(?P<send_email>{EMAIL_PATTERN})|(?P<create_calendar_event>{CALENDAR_PATTERN})|(?P<post_tweet>{TWEET_PATTERN})',
+        re.DOTALL,
+    )
+    KEYWORD_PATTERN = re.compile(r'(?:SEND_EMAIL|CREATE_EVENT|POST_TWEET):')
     
-    def __init__(self, tool_executor):
+    def __init__(
+        self,
+        tool_executor,
+        pool: Optional[ToolExecutionPool] = None,
+        idempotency: Optional[IdempotencyStore] = None,
+    ):
         self.tool_executor = tool_executor
+        self.pool = pool or get_tool_pool()
+        self.idempotency = idempotency or get_idempotency_store()
+    
+    def scan(self, agent_output: str, position: int = 0) -> List[ToolCommand]:
+        """Find every tool command in document order (from `position`) without executing anything"""
+        commands = []
+        while True:
+            keyword = self.KEYWORD_PATTERN.search(agent_output, position)
+            if keyword is None:
+                break
+            match = self.COMMAND_PATTERN.match(agent_output, keyword.start())
+            if match is None:
+                position = keyword.end()
+                continue
+            position = match.end()
+            commands.append(self._command(match))
+        return commands
+    
+    @staticmethod
+    def _command(match: re.Match) -> ToolCommand:
+        tool = match.lastgroup
+        if tool == 'send_email':
+            params = {
+                'to': match.group('email_to').strip(),
+                'subject': match.group('email_subject').strip(),
+                'body': match.group('email_body').strip(),
+            }
+        elif tool == 'create_calendar_event':
+            params = {
+                'title': match.group('event_title').strip(),
+                'date': match.group('event_date').strip(),
+                'time': match.group('event_time').strip(),
+            }
+        else:
+            params = {'text': match.group('tweet_text').strip()}
+        return ToolCommand(tool, params, match.start(), match.end())
+    
+    @staticmethod
+    def _log_command(command: ToolCommand) -> None:
+        params = command.params
+        if command.tool == 'send_email':
+            logger.info(f"📧 Detected EMAIL command: to={params['to']}")
+        elif command.tool == 'create_calendar_event':
+            logger.info(f"📅 Detected CALENDAR command: {params['title']}")
+        else:
+            logger.info(f"🐦 Detected TWEET command: {params['text'][:50]}...")
+    
+    def execute_command(self, command: ToolCommand) -> str:
+        """Run one scanned command through the tool executor"""
+        self._log_command(command)
+        params = command.params
+        if command.tool == 'send_email':
+            return self.tool_executor.send_email(params['to'], params['subject'], params['body'])
+        if command.tool == 'create_calendar_event':
+            return self.tool_executor.create_calendar_event(params['title'], params['date'], params['time'])
+        return self.tool_executor.post_tweet(params['text'])
+    
+    def _execute_isolated(self, command: ToolCommand) -> str:
+        """A failing command becomes its error message instead of failing its siblings"""
+        try:
+            return self.execute_command(command)
+        except Exception as e:
+            logger.error(f"Tool execution failed: {e}")
+            return f"❌ Tool execution failed: {str(e)}"
+    
+    async def _aexecute_isolated(self, command: ToolCommand) -> str:
+        self._log_command(command)
+        try:
+            return await self.tool_executor.execute_tool_async(command.tool, command.params)
+        except Exception as e:
+            logger.error(f"Tool execution failed: {e}")
+            return f"❌ Tool execution failed: {str(e)}"
+    
+    def _units(self, commands: List[ToolCommand], batch_method: str) -> List[List[ToolCommand]]:
+        """
+        Group commands into execution units: all commands of a batchable tool
+        (Gmail, Calendar) form one unit, every other command is its own unit
+        """
+        batchable = ()
+        if hasattr(self.tool_executor, batch_method):
+            batchable = getattr(self.tool_executor, 'BATCHABLE_TOOLS', ())
+        
+        units: List[List[ToolCommand]] = []
+        batches: Dict[str, List[ToolCommand]] = {}
+        for command in commands:
+            if command.tool in batchable:
+                if command.tool not in batches:
+                    batches[command.tool] = []
+                    units.append(batches[command.tool])
+                batches[command.tool].append(command)
+            else:
+                units.append([command])
+        return units
+    
+    @staticmethod
+    def _rate_limit_args(unit: List[ToolCommand]) -> Tuple[str, Optional[str], int]:
+        """(provider, user_id, requests) for a unit; each command in a batch counts against the quota"""
+        context = get_current_workflow()
+        provider = TOOL_PROVIDERS.get(unit[0].tool, unit[0].tool)
+        return provider, context.user_id if context else None, len(unit)
+    
+    @staticmethod
+    def _emit_unit(event_type: str, unit: List[ToolCommand], results: Optional[List[str]] = None) -> None:
+        """Publish tool_start / tool_end events to the workflow's stream subscribers"""
+        for index, command in enumerate(unit):
+            data = {"tool": command.tool, "params": command.params}
+            if results is not None:
+                data["result"] = results[index]
+            emit(event_type, **data)
+    
+    def _execute_unit(self, unit: List[ToolCommand]) -> List[str]:
+        self._emit_unit("tool_start", unit)
+        results = self._run_unit(unit)
+        self._emit_unit("tool_end", unit, results)
+        return results
+    
+    def _run_unit(self, unit: List[ToolCommand]) -> List[str]:
+        if len(unit) == 1:
+            return [self._execute_isolated(unit[0])]
+        for command in unit:
+            self._log_command(command)
+        try:
+            return self.tool_executor.execute_batch(unit[0].tool, [command.params for command in unit])
+        except Exception as e:
+            logger.error(f"Batch tool execution failed: {e}")
+            return [f"❌ Tool execution failed: {str(e)}"] * len(unit)
+    
+    async def _aexecute_unit(self, unit: List[ToolCommand]) -> List[str]:
+        self._emit_unit("tool_start", unit)
+        results = await self._arun_unit(unit)
+        self._emit_unit("tool_end", unit, results)
+        return results
+    
+    async def _arun_unit(self, unit: List[ToolCommand]) -> List[str]:
+        if len(unit) == 1:
+            return [await self._aexecute_isolated(unit[0])]
+        for command in unit:
+            self._log_command(command)
+        try:
+            return await self.tool_executor.execute_batch_async(unit[0].tool, [command.params for command in unit])
+        except Exception as e:
+            logger.error(f"Batch tool execution failed: {e}")
+            return [f"❌ Tool execution failed: {str(e)}"] * len(unit)
+    
+    def _submit(self, unit: List[ToolCommand]):
+        # Wait for the tool budget before queueing, so throttled units do not hold pool threads
+        provider, user_id, requests = self._rate_limit_args(unit)
+        get_rate_limiter().acquire_blocking(provider, user_id=user_id, requests=requests)
+        return self._submit_now(unit)
+    
+    def _submit_now(self, unit: List[ToolCommand]):
+        # Carry the workflow context into the worker thread
+        context = contextvars.copy_context()
+        return self.pool.submit(unit[0].tool, context.run, self._execute_unit, unit)
+    
+    async def _asubmit(self, unit: List[ToolCommand], native: bool) -> List[str]:
+        """Wait for the tool budget on the event loop, then run the unit in its pool slot"""
+        provider, user_id, requests = self._rate_limit_args(unit)
+        await get_rate_limiter().acquire(provider, user_id=user_id, requests=requests)
+        if native:
+            return await self.pool.run_async(unit[0].tool, self._aexecute_unit, unit)
+        return await asyncio.wrap_future(self._submit_now(unit))
+    
+    def _claim(self, commands: List[ToolCommand]):
+        """
+        Split commands into the ones to execute and the ones the idempotency
+        store answers (already executed in this workflow, or running right now).
+        
+        Returns (to_run, answered, waits, keys): answered/waits are keyed by
+        command index, keys maps id(command) of owned commands to their key.
+        """
+        answered: Dict[int, str] = {}
+        waits: Dict[int, Any] = {}
+        keys: Dict[int, str] = {}
+        context = get_current_workflow()
+        if self.idempotency is None or context is None:
+            return list(commands), answered, waits, keys
+        
+        to_run = []
+        for index, command in enumerate(commands):
+            key = idempotency_key(context.trace_id, command.tool, command.params)
+            state, value = self.idempotency.claim(key)
+            if state == "owner":
+                keys[id(command)] = key
+                to_run.append(command)
+                continue
+            logger.info(f"♻️ Skipped duplicate {command.tool} command (already executed in this workflow)")
+            context.record("tool_idempotency", "duplicates")
+            if state == "hit":
+                answered[index] = value
+            else:
+                waits[index] = value
+        return to_run, answered, waits, keys
+    
+    def _settle(self, to_run: List[ToolCommand], run_results: List[str], keys: Dict[int, str]) -> None:
+        """Publish owned results to the idempotency store"""
+        for command, result in zip(to_run, run_results):
+            key = keys.pop(id(command), None)
+            if key is not None:
+                self.idempotency.complete(key, result)
+    
+    def _release(self, keys: Dict[int, str], error: BaseException) -> None:
+        for key in keys.values():
+            self.idempotency.abandon(key, error)
+        keys.clear()
+    
+    @staticmethod
+    def _merge(commands: List[ToolCommand], to_run: List[ToolCommand], run_results: List[str], answered: Dict[int, str]) -> List[str]:
+        by_command = {id(command): result for command, result in zip(to_run, run_results)}
+        return [
+            answered[index] if index in answered else by_command[id(command)]
+            for index, command in enumerate(commands)
+        ]
+    
+    @staticmethod
+    def _collect(commands: List[ToolCommand], units: List[List[ToolCommand]], unit_results: List[List[str]]) -> List[str]:
+        """Flatten per-unit results back into document order"""
+        by_command = {}
+        for unit, results in zip(units, unit_results):
+            for command, result in zip(unit, results):
+                by_command[id(command)] = result
+        return [by_command[id(command)] for command in commands]
+    
+    @staticmethod
+    def render(agent_output: str, commands: List[ToolCommand], results: List[str]) -> str:
+        """Replace each command span with its result in a single join"""
+        pieces = []
+        position = 0
+        for command, result in zip(commands, results):
+            pieces.append(agent_output[position:command.start])
+            pieces.append(result)
+            position = command.end
+        pieces.append(agent_output[position:])
+        return ''.join(pieces)
     
     def parse_and_execute(self, agent_output: str) -> Tuple[str, List[str]]:
         """
@@ -28,56 +304,69 @@ class ToolCommandParser:
         Returns:
             (modified_output, tool_results) - Output with tool results, and list of results
         """
-        tool_results = []
-        modified_output = agent_output
-        
-        # Check for email commands
-        email_matches = re.finditer(self.EMAIL_PATTERN, agent_output, re.DOTALL)
-        for match in email_matches:
-            to = match.group(1).strip()
-            subject = match.group(2).strip()
-            body = match.group(3).strip()
-            
-            logger.info(f"📧 Detected EMAIL command: to={to}")
-            result = self.tool_executor.send_email(to, subject, body)
-            tool_results.append(result)
-            
-            # Replace command with result in output
-            modified_output = modified_output.replace(match.group(0), result)
-        
-        # Check for calendar commands
-        calendar_matches = re.finditer(self.CALENDAR_PATTERN, agent_output, re.DOTALL)
-        for match in calendar_matches:
-            title = match.group(1).strip()
-            date = match.group(2).strip()
-            time = match.group(3).strip()
-            
-            logger.info(f"📅 Detected CALENDAR command: {title}")
-            result = self.tool_executor.create_calendar_event(title, date, time)
-            tool_results.append(result)
-            
-            # Replace command with result
-            modified_output = modified_output.replace(match.group(0), result)
+        commands = self.scan(agent_output)
+        to_run, answered, waits, keys = self._claim(commands)
+        try:
+            # Units run concurrently within their per-tool limits; results keep document order
+            units = self._units(to_run, 'execute_batch')
+            futures = [self._submit(unit) for unit in units]
+            run_results = self._collect(to_run, units, [future.result() for future in futures])
+        except BaseException as e:
+            self._release(keys, e)
+            raise
+        self._settle(to_run, run_results, keys)
         
-        # Check for tweet commands
-        tweet_matches = re.finditer(self.TWEET_PATTERN, agent_output, re.DOTALL)
-        for match in tweet_matches:
-            text = match.group(1).strip()
-            
-            logger.info(f"🐦 Detected TWEET command: {text[:50]}...")
-            result = self.tool_executor.post_tweet(text)
-            tool_results.append(result)
-            
-            # Replace command with result
-            modified_output = modified_output.replace(match.group(0), result)
+        for index, future in waits.items():
+            try:
+                answered[index] = future.result()
+            except Exception as e:
+                answered[index] = f"❌ Tool execution failed: {str(e)}"
+        tool_results = self._merge(commands, to_run, run_results, answered)
+        return self._finish(agent_output, commands, tool_results)
+    
+    async def aparse_and_execute(self, agent_output: str) -> Tuple[str, List[str]]:
+        """Async variant of parse_and_execute that never blocks the event loop"""
+        commands = self.scan(agent_output)
+        tool_results = await self._aexecute_commands(commands)
+        return self._finish(agent_output, commands, tool_results)
+    
+    async def _aexecute_commands(self, commands: List[ToolCommand]) -> List[str]:
+        """Execute scanned commands without blocking the event loop; results in document order"""
+        to_run, answered, waits, keys = self._claim(commands)
+        try:
+            if hasattr(self.tool_executor, 'execute_tool_async'):
+                # Native async tools share pooled connections on the event loop
+                units = self._units(to_run, 'execute_batch_async')
+                pending = [self._asubmit(unit, native=True) for unit in units]
+            else:
+                units = self._units(to_run, 'execute_batch')
+                pending = [self._asubmit(unit, native=False) for unit in units]
+            run_results = self._collect(to_run, units, list(await asyncio.gather(*pending)))
+        except BaseException as e:
+            self._release(keys, e)
+            raise
+        self._settle(to_run, run_results, keys)
         
+        for index, future in waits.items():
+            try:
+                # Shielded so a cancelled waiter does not cancel the owner's shared future
+                answered[index] = await asyncio.shield(asyncio.wrap_future(future))
+            except Exception as e:
+                answered[index] = f"❌ Tool execution failed: {str(e)}"
+        return self._merge(commands, to_run, run_results, answered)
+    
+    def streaming(self) -> "StreamingToolCommandParser":
+        """A parser for one streamed response, sharing this parser's executor, pool and idempotency store"""
+        return StreamingToolCommandParser(self.tool_executor, pool=self.pool, idempotency=self.idempotency)
+    
+    def _finish(self, agent_output: str, commands: List[ToolCommand], tool_results: List[str]) -> Tuple[str, List[str]]:
         # Log if no tools were detected
         if not tool_results:
             logger.debug("No tool commands detected in agent output")
-        else:
-            logger.info(f"✅ Executed {len(tool_results)} tools")
+            return agent_output, tool_results
         
-        return modified_output, tool_results
+        logger.info(f"✅ Executed {len(tool_results)} tools")
+        return self.render(agent_output, commands, tool_results), tool_results
     
     def extract_structured_data(self, text: str) -> Dict[str, Any]:
         """
@@ -98,6 +387,106 @@ class ToolCommandParser:
         return data
 
 
+
+class StreamingToolCommandParser(ToolCommandParser):
+    """
+    Detects tool commands in a streamed LLM response and starts them while the
+    model keeps generating.
+
+    A match is only final once text follows it: SEND_EMAIL and POST_TWEET end at
+    the next `\\n[A-Z_]+:` boundary, CREATE_EVENT at the end of its line. Until
+    then more tokens could still extend it. Commands found in one feed() are
+    batched together; finish() scans the remainder and renders the output
+    exactly like aparse_and_execute would on the full text.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._text = ''
+        self._position = 0
+        self._blocked = False
+        self._commands: List[ToolCommand] = []
+        self._tasks: List[Tuple[List[ToolCommand], asyncio.Task]] = []
+    
+    @property
+    def text(self) -> str:
+        return self._text
+    
+    # A pending command can only become complete through one of these
+    _BOUNDARY_CHARS = frozenset(':|\n')
+    
+    def feed(self, chunk: str) -> List[ToolCommand]:
+        """Add a token chunk; commands completed by it start executing right away"""
+        self._text += chunk
+        if self._blocked and self._BOUNDARY_CHARS.isdisjoint(chunk):
+            # Still inside the same command; skip re-matching its growing body
+            return []
+        commands = self._scan_final()
+        if commands:
+            self._start(commands)
+        return commands
+    
+    def _scan_final(self) -> List[ToolCommand]:
+        """Commands between the scan position and the last point no later token can change"""
+        text = self._text
+        # `$` also matches before a trailing newline, so that newline is not a boundary yet
+        stable_end = len(text) - 1 if text.endswith('\n') else len(text)
+        commands = []
+        self._blocked = False
+        while True:
+            keyword = self.KEYWORD_PATTERN.search(text, self._position)
+            if keyword is None:
+                # A keyword may be split across chunks; keep its possible prefix unscanned
+                self._position = max(self._position, len(text) - len('CREATE_EVENT:'))
+                break
+            match = self.COMMAND_PATTERN.match(text, keyword.start())
+            if match is None or match.end() >= stable_end:
+                # Incomplete (or malformed) so far; finish() decides with the full text
+                self._position = keyword.start()
+                self._blocked = True
+                break
+            self._position = match.end()
+            commands.append(self._command(match))
+        self._commands.extend(commands)
+        return commands
+    
+    def _start(self, commands: List[ToolCommand]) -> None:
+        for command in commands:
+            logger.info(f"⚡ {command.tool} detected mid-stream, executing while the model generates")
+        task = asyncio.ensure_future(self._aexecute_commands(commands))
+        self._tasks.append((commands, task))
+    
+    async def finish(self) -> Tuple[str, List[str]]:
+        """End of stream: run the remaining commands, wait for all, return (modified_output, tool_results)"""
+        rest = self.scan(self._text, self._position)
+        self._commands.extend(rest)
+        if rest:
+            self._start(rest)
+        
+        results: Dict[int, str] = {}
+        for commands, task in self._tasks:
+            for command, result in zip(commands, await task):
+                results[id(command)] = result
+        tool_results = [results[id(command)] for command in self._commands]
+        return self._finish(self._text, self._commands, tool_results)
+    
+    def abandon(self) -> None:
+        """
+        The stream failed: let started commands finish (their results stay in the idempotency store).
+        Their side effects cannot be undone, which is why early dispatch is opt-in (TOOL_EARLY_DISPATCH).
+        """
+        if self._tasks:
+            logger.warning(f"⚠️ Stream failed after {len(self._commands)} tool command(s) already started")
+        for _, task in self._tasks:
+            task.add_done_callback(self._log_abandoned)
+        self._tasks = []
+    
+    @staticmethod
+    def _log_abandoned(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Tool execution failed after the stream was abandoned: {task.exception()}")
+
+
 def enhance_agent_prompt_with_tools(persona: str) -> str:
     """
     Add tool usage instructions to agent persona
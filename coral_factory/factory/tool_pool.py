@@ -0,0 +1,138 @@
+"""
+Tool execution pool
+Bounds tool calls (Gmail, Calendar, X) per tool: blocking calls run on one
+thread pool per tool, async calls wait on one limiter per tool, so a burst of
+one tool can neither starve the others nor the event loop
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from factory.concurrency import ConcurrencyLimiter
+
+logger = logging.getLogger(__name__)
+
+TOOL_NAMES = ("send_email", "create_calendar_event", "post_tweet")
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "10"))  # Default in-flight calls per tool
+# Per-tool overrides, e.g. TOOL_CONCURRENCY_POST_TWEET=2
+TOOL_CONCURRENCY = {
+    tool: int(os.getenv(f"TOOL_CONCURRENCY_{tool.upper()}", str(TOOL_MAX_CONCURRENCY)))
+    for tool in TOOL_NAMES
+}
+
+
+class ToolExecutionPool:
+    """One ThreadPoolExecutor and one async limiter per tool, both sized to that tool's limit"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = TOOL_MAX_CONCURRENCY):
+        self.limits = dict(limits or TOOL_CONCURRENCY)
+        self.default_limit = default_limit
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def limit(self, tool: str) -> int:
+        return max(1, self.limits.get(tool, self.default_limit))
+
+    def _ensure_stats_locked(self, tool: str) -> None:
+        if tool not in self._stats:
+            self._stats[tool] = {"submitted": 0, "in_flight": 0, "completed": 0, "failed": 0}
+
+    def _executor(self, tool: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(tool)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.limit(tool), thread_name_prefix=f"tool-{tool}")
+                self._executors[tool] = executor
+                self._ensure_stats_locked(tool)
+            return executor
+
+    def _limiter(self, tool: str) -> ConcurrencyLimiter:
+        with self._lock:
+            limiter = self._limiters.get(tool)
+            if limiter is None:
+                limiter = ConcurrencyLimiter(self.limit(tool), name=f"tool:{tool}")
+                self._limiters[tool] = limiter
+                self._ensure_stats_locked(tool)
+            return limiter
+
+    def submit(self, tool: str, func: Callable[..., Any], *args: Any) -> Future:
+        """Queue func(*args) behind the tool's limit"""
+        executor = self._executor(tool)
+        with self._lock:
+            self._stats[tool]["submitted"] += 1
+        return executor.submit(self._run, tool, func, *args)
+
+    async def run_async(self, tool: str, func: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Await func(*args) once the tool has a free slot"""
+        limiter = self._limiter(tool)
+        with self._lock:
+            self._stats[tool]["submitted"] += 1
+        await limiter.acquire()
+        start = time.perf_counter()
+        self._count(tool, "in_flight", 1)
+        try:
+            result = await func(*args)
+        except BaseException:
+            self._count(tool, "failed", 1)
+            raise
+        finally:
+            self._count(tool, "in_flight", -1)
+            limiter.release(time.perf_counter() - start)
+        self._count(tool, "completed", 1)
+        return result
+
+    def _run(self, tool: str, func: Callable[..., Any], *args: Any) -> Any:
+        self._count(tool, "in_flight", 1)
+        try:
+            result = func(*args)
+        except Exception:
+            self._count(tool, "failed", 1)
+            raise
+        finally:
+            self._count(tool, "in_flight", -1)
+        self._count(tool, "completed", 1)
+        return result
+
+    def _count(self, tool: str, metric: str, amount: int) -> None:
+        with self._lock:
+            self._stats[tool][metric] += amount
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                tool: {"limit": self.limit(tool), **counters}
+                for tool, counters in self._stats.items()
+            }
+
+
+# Global instance
+_tool_pool: Optional[ToolExecutionPool] = None
+_tool_pool_lock = threading.Lock()
+
+def get_tool_pool() -> ToolExecutionPool:
+    """Get or create the process-wide tool execution pool"""
+    global _tool_pool
+    if _tool_pool is None:
+        with _tool_pool_lock:
+            if _tool_pool is None:
+                _tool_pool = ToolExecutionPool()
+    return _tool_pool
+
+
+def shutdown_tool_pool() -> None:
+    """Stop accepting tool calls; in-flight calls finish in the background"""
+    if _tool_pool is not None:
+        _tool_pool.shutdown(wait=False)
@@ -3,21 +3,52 @@ Simple tool integrations for Gmail, Google Calendar, and X (Twitter)
 These are called directly by the agent via command parsing
 """
 
+import asyncio
 import logging
 import os
-from typing import Dict, Any, Optional
+import threading
+import weakref
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
+from factory.google_batch import (
+    CALENDAR_BATCH_PATH,
+    GMAIL_BATCH_PATH,
+    batch_error_message,
+    decode_batch,
+    encode_batch,
+)
+
 logger = logging.getLogger(__name__)
 
+# Async HTTP layer (used by execute_tool_async)
+TOOL_HTTP_TIMEOUT_SECONDS = float(os.getenv("TOOL_HTTP_TIMEOUT_SECONDS", "15"))
+TOOL_HTTP_MAX_CONNECTIONS = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "20"))  # Per service
+TOOL_HTTP_MAX_KEEPALIVE = int(os.getenv("TOOL_HTTP_MAX_KEEPALIVE", "10"))  # Idle connections kept per service
+GMAIL_API_URL = os.getenv("GMAIL_API_URL", "https://gmail.googleapis.com")
+CALENDAR_API_URL = os.getenv("CALENDAR_API_URL", "https://www.googleapis.com")
+TWITTER_API_URL = os.getenv("TWITTER_API_URL", "https://api.twitter.com")
+# Same-service Gmail/Calendar commands from one agent output go out as batch requests
+TOOL_BATCH_SIZE = max(1, min(int(os.getenv("TOOL_BATCH_SIZE", "50")), 100))  # Gmail allows at most 100 per batch
+# Use dummy credentials against the URLs above (local stand-in servers for load tests)
+TOOL_TEST_MODE = os.getenv("TOOL_TEST_MODE", "false").lower() == "true"
+
 
 class ToolExecutor:
     """Executes tool commands for agents"""
     
-    def __init__(self):
+    def __init__(self, test_mode: bool = TOOL_TEST_MODE):
         self.gmail_service = None
         self.calendar_service = None
         self.twitter_client = None
+        self.test_mode = test_mode
+        self._google_credentials = None
+        self._twitter_keys = None
+        self._thread_local = threading.local()
+        self._credentials_lock = threading.Lock()
+        # Async connection pools, one set per event loop
+        self._http_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._http_clients_lock = threading.Lock()
         self._initialized = False
     
     def initialize(self):
@@ -25,6 +56,11 @@ class ToolExecutor:
         if self._initialized:
             return
         
+        if self.test_mode:
+            self._initialized = True
+            logger.info(f"🧪 Tool executor in test mode (Gmail: {GMAIL_API_URL}, Calendar: {CALENDAR_API_URL}, X: {TWITTER_API_URL})")
+            return
+        
         try:
             # Initialize Gmail and Calendar
             self._init_google_services()
@@ -71,6 +107,7 @@ class ToolExecutor:
                     return
             
             # Build services
+            self._google_credentials = creds
             self.gmail_service = build('gmail', 'v1', credentials=creds)
             self.calendar_service = build('calendar', 'v3', credentials=creds)
             logger.info("✅ Google services initialized")
@@ -91,6 +128,7 @@ class ToolExecutor:
             access_secret = os.getenv('TWITTER_ACCESS_SECRET')
             
             if all([api_key, api_secret, access_token, access_secret]):
+                self._twitter_keys = (api_key, api_secret, access_token, access_secret)
                 # Use API v2 for free tier
                 self.twitter_client = tweepy.Client(
                     consumer_key=api_key,
@@ -107,25 +145,36 @@ class ToolExecutor:
         except Exception as e:
             logger.warning(f"Failed to initialize Twitter: {e}")
     
+    def _google_http(self):
+        """Per-thread authorized transport; httplib2 connections are not thread-safe"""
+        http = getattr(self._thread_local, 'google_http', None)
+        if http is None:
+            import google_auth_httplib2
+            import httplib2
+            http = google_auth_httplib2.AuthorizedHttp(self._google_credentials, http=httplib2.Http())
+            self._thread_local.google_http = http
+        return http
+    
     # ==================== GMAIL ====================
     
+    @staticmethod
+    def _encode_email(to: str, subject: str, body: str) -> str:
+        from email.mime.text import MIMEText
+        import base64
+        
+        message = MIMEText(body)
+        message['to'] = to
+        message['subject'] = subject
+        return base64.urlsafe_b64encode(message.as_bytes()).decode()
+    
     def send_email(self, to: str, subject: str, body: str) -> str:
         """Send an email via Gmail"""
         try:
             if self.gmail_service:
-                from email.mime.text import MIMEText
-                import base64
-                
-                message = MIMEText(body)
-                message['to'] = to
-                message['subject'] = subject
-                
-                raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-                
                 result = self.gmail_service.users().messages().send(
                     userId='me',
-                    body={'raw': raw}
-                ).execute()
+                    body={'raw': self._encode_email(to, subject, body)}
+                ).execute(http=self._google_http())
                 
                 logger.info(f"✅ Email sent to {to}")
                 return f"✅ Email sent successfully to {to} (ID: {result['id']})"
@@ -140,6 +189,24 @@ class ToolExecutor:
     
     # ==================== GOOGLE CALENDAR ====================
     
+    @staticmethod
+    def _calendar_event(title: str, date: str, time: str, duration_hours: int) -> Dict[str, Any]:
+        # Parse date and time
+        start_datetime = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+        end_datetime = start_datetime + timedelta(hours=duration_hours)
+        
+        return {
+            'summary': title,
+            'start': {
+                'dateTime': start_datetime.isoformat(),
+                'timeZone': 'America/New_York',
+            },
+            'end': {
+                'dateTime': end_datetime.isoformat(),
+                'timeZone': 'America/New_York',
+            },
+        }
+    
     def create_calendar_event(
         self, 
         title: str, 
@@ -150,26 +217,10 @@ class ToolExecutor:
         """Create a Google Calendar event"""
         try:
             if self.calendar_service:
-                # Parse date and time
-                start_datetime = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-                end_datetime = start_datetime + timedelta(hours=duration_hours)
-                
-                event = {
-                    'summary': title,
-                    'start': {
-                        'dateTime': start_datetime.isoformat(),
-                        'timeZone': 'America/New_York',
-                    },
-                    'end': {
-                        'dateTime': end_datetime.isoformat(),
-                        'timeZone': 'America/New_York',
-                    },
-                }
-                
                 result = self.calendar_service.events().insert(
                     calendarId='primary',
-                    body=event
-                ).execute()
+                    body=self._calendar_event(title, date, time, duration_hours)
+                ).execute(http=self._google_http())
                 
                 logger.info(f"✅ Calendar event created: {title}")
                 return f"✅ Event created: {title} on {date} at {time} - {result.get('htmlLink')}"
@@ -234,16 +285,315 @@ class ToolExecutor:
         except Exception as e:
             logger.error(f"Tool execution failed: {e}")
             return f"❌ Tool execution failed: {str(e)}"
+    
+    # ==================== ASYNC HTTP ====================
+    
+    def _http_client(self, service: str):
+        """Keep-alive connection pool for one service on the running event loop"""
+        import httpx
+        
+        loop = asyncio.get_running_loop()
+        with self._http_clients_lock:
+            clients = self._http_clients.setdefault(loop, {})
+            client = clients.get(service)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(TOOL_HTTP_TIMEOUT_SECONDS),
+                    limits=httpx.Limits(
+                        max_connections=TOOL_HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=TOOL_HTTP_MAX_KEEPALIVE,
+                    ),
+                )
+                clients[service] = client
+        return client
+    
+    async def aclose(self) -> None:
+        """Close the connection pools opened on the running event loop"""
+        with self._http_clients_lock:
+            clients = self._http_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+    
+    @property
+    def google_async_enabled(self) -> bool:
+        return self.test_mode or self._google_credentials is not None
+    
+    @property
+    def twitter_async_enabled(self) -> bool:
+        return self.test_mode or self._twitter_keys is not None
+    
+    async def _google_headers(self) -> Dict[str, str]:
+        if self.test_mode:
+            return {'Authorization': 'Bearer test-token'}
+        if not self._google_credentials.valid:
+            # Token refresh is a blocking call; do it once, off the event loop
+            await asyncio.to_thread(self._refresh_google_credentials)
+        return {'Authorization': f'Bearer {self._google_credentials.token}'}
+    
+    def _refresh_google_credentials(self) -> None:
+        from google.auth.transport.requests import Request
+        
+        with self._credentials_lock:
+            if not self._google_credentials.valid:
+                self._google_credentials.refresh(Request())
+    
+    def _twitter_headers(self, url: str) -> Dict[str, str]:
+        """OAuth 1.0a user-context signature for a JSON POST"""
+        from oauthlib.oauth1 import Client
+        
+        api_key, api_secret, access_token, access_secret = self._twitter_keys or ('test',) * 4
+        client = Client(
+            api_key,
+            client_secret=api_secret,
+            resource_owner_key=access_token,
+            resource_owner_secret=access_secret,
+        )
+        _, headers, _ = client.sign(url, http_method='POST', headers={'Content-Type': 'application/json'})
+        return headers
+    
+    async def send_email_async(self, to: str, subject: str, body: str) -> str:
+        """Send an email via the Gmail REST API on a pooled connection"""
+        try:
+            if self.google_async_enabled:
+                response = await self._http_client('google').post(
+                    f"{GMAIL_API_URL}/gmail/v1/users/me/messages/send",
+                    json={'raw': self._encode_email(to, subject, body)},
+                    headers=await self._google_headers(),
+                )
+                response.raise_for_status()
+                
+                logger.info(f"✅ Email sent to {to}")
+                return f"✅ Email sent successfully to {to} (ID: {response.json()['id']})"
+            else:
+                # Simulated response
+                logger.info(f"📧 [SIMULATED] Email to {to}: {subject}")
+                return f"📧 [SIMULATED] Email sent to {to} with subject: {subject}"
+                
+        except Exception as e:
+            logger.error(f"Failed to send email: {e}")
+            return f"❌ Failed to send email: {str(e)}"
+    
+    async def create_calendar_event_async(
+        self,
+        title: str,
+        date: str,
+        time: str = "10:00",
+        duration_hours: int = 1
+    ) -> str:
+        """Create a Google Calendar event via the REST API on a pooled connection"""
+        try:
+            if self.google_async_enabled:
+                response = await self._http_client('google').post(
+                    f"{CALENDAR_API_URL}/calendar/v3/calendars/primary/events",
+                    json=self._calendar_event(title, date, time, duration_hours),
+                    headers=await self._google_headers(),
+                )
+                response.raise_for_status()
+                
+                logger.info(f"✅ Calendar event created: {title}")
+                return f"✅ Event created: {title} on {date} at {time} - {response.json().get('htmlLink')}"
+            else:
+                # Simulated response
+                logger.info(f"📅 [SIMULATED] Event: {title} on {date} at {time}")
+                return f"📅 [SIMULATED] Calendar event created: {title} on {date} at {time}"
+                
+        except Exception as e:
+            logger.error(f"Failed to create calendar event: {e}")
+            return f"❌ Failed to create event: {str(e)}"
+    
+    async def post_tweet_async(self, text: str) -> str:
+        """Post a tweet via the X API v2 on a pooled connection"""
+        try:
+            if self.twitter_async_enabled:
+                # Truncate if too long (280 char limit)
+                if len(text) > 280:
+                    text = text[:277] + "..."
+                
+                url = f"{TWITTER_API_URL}/2/tweets"
+                response = await self._http_client('twitter').post(
+                    url,
+                    json={'text': text},
+                    headers=self._twitter_headers(url),
+                )
+                response.raise_for_status()
+                tweet_id = response.json()['data']['id']
+                tweet_url = f"https://twitter.com/user/status/{tweet_id}"
+                
+                logger.info(f"✅ Tweet posted: {text[:50]}...")
+                return f"✅ Tweet posted: {tweet_url}"
+            else:
+                # Simulated response
+                logger.info(f"🐦 [SIMULATED] Tweet: {text[:50]}...")
+                return f"🐦 [SIMULATED] Tweet posted: {text[:100]}"
+                
+        except Exception as e:
+            logger.error(f"Failed to post tweet: {e}")
+            # Check if it's access level issue
+            if "403" in str(e) or "access level" in str(e).lower():
+                logger.warning("⚠️ Twitter Free tier detected - using simulation")
+                logger.info(f"🐦 [SIMULATED] Tweet: {text[:50]}...")
+                return f"🐦 [SIMULATED - Free Tier] Tweet: {text[:100]}"
+            return f"❌ Failed to post tweet: {str(e)}"
+    
+    async def execute_tool_async(self, tool_name: str, params: Dict[str, Any]) -> str:
+        """Execute a tool by name with parameters without blocking the event loop"""
+        try:
+            tool_map = {
+                'send_email': self.send_email_async,
+                'create_calendar_event': self.create_calendar_event_async,
+                'post_tweet': self.post_tweet_async,
+            }
+            
+            if tool_name not in tool_map:
+                return f"❌ Unknown tool: {tool_name}"
+            
+            return await tool_map[tool_name](**params)
+            
+        except Exception as e:
+            logger.error(f"Tool execution failed: {e}")
+            return f"❌ Tool execution failed: {str(e)}"
+    
+    # ==================== BATCHING ====================
+    
+    BATCHABLE_TOOLS = ('send_email', 'create_calendar_event')
+    
+    def _batch_call(self, tool_name: str, params: Dict[str, Any]):
+        """(method, path, json body) of one Google REST call"""
+        if tool_name == 'send_email':
+            body = {'raw': self._encode_email(params['to'], params['subject'], params['body'])}
+            return 'POST', '/gmail/v1/users/me/messages/send', body
+        body = self._calendar_event(
+            params['title'], params['date'], params.get('time', '10:00'), params.get('duration_hours', 1)
+        )
+        return 'POST', '/calendar/v3/calendars/primary/events', body
+    
+    def _batch_success(self, tool_name: str, params: Dict[str, Any], response: Dict[str, Any]) -> str:
+        if tool_name == 'send_email':
+            logger.info(f"✅ Email sent to {params['to']}")
+            return f"✅ Email sent successfully to {params['to']} (ID: {response.get('id')})"
+        logger.info(f"✅ Calendar event created: {params['title']}")
+        return f"✅ Event created: {params['title']} on {params['date']} at {params.get('time', '10:00')} - {response.get('htmlLink')}"
+    
+    def _batch_failure(self, tool_name: str, error: Any) -> str:
+        if tool_name == 'send_email':
+            logger.error(f"Failed to send email: {error}")
+            return f"❌ Failed to send email: {error}"
+        logger.error(f"Failed to create calendar event: {error}")
+        return f"❌ Failed to create event: {error}"
+    
+    def _prepare_batch(self, tool_name: str, params_list: List[Dict[str, Any]], results: List[Optional[str]]) -> Dict[int, tuple]:
+        """Calls that can join a batch, by index; bad arguments fail on their own"""
+        calls = {}
+        for index, params in enumerate(params_list):
+            try:
+                calls[index] = self._batch_call(tool_name, params)
+            except Exception as e:
+                results[index] = self._batch_failure(tool_name, e)
+        return calls
+    
+    def execute_batch(self, tool_name: str, params_list: List[Dict[str, Any]]) -> List[str]:
+        """Run several calls of one Google tool as batch requests; results keep input order"""
+        service = self.gmail_service if tool_name == 'send_email' else self.calendar_service
+        if tool_name not in self.BATCHABLE_TOOLS or service is None:
+            return [self.execute_tool(tool_name, params) for params in params_list]
+        
+        results: List[Optional[str]] = [None] * len(params_list)
+        calls = self._prepare_batch(tool_name, params_list, results)
+        ready = list(calls)
+        
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is not None:
+                results[index] = self._batch_failure(tool_name, exception)
+            else:
+                results[index] = self._batch_success(tool_name, params_list[index], response)
+        
+        for start in range(0, len(ready), TOOL_BATCH_SIZE):
+            chunk = ready[start:start + TOOL_BATCH_SIZE]
+            batch = service.new_batch_http_request(callback=callback)
+            for index in chunk:
+                body = calls[index][2]
+                if tool_name == 'send_email':
+                    request = service.users().messages().send(userId='me', body=body)
+                else:
+                    request = service.events().insert(calendarId='primary', body=body)
+                batch.add(request, request_id=str(index))
+            try:
+                batch.execute(http=self._google_http())
+                logger.info(f"📦 Sent {len(chunk)} {tool_name} calls in one batch request")
+            except Exception as e:
+                for index in chunk:
+                    if results[index] is None:
+                        results[index] = self._batch_failure(tool_name, e)
+        return results
+    
+    async def execute_batch_async(self, tool_name: str, params_list: List[Dict[str, Any]]) -> List[str]:
+        """Async variant of execute_batch over the pooled connections"""
+        if tool_name not in self.BATCHABLE_TOOLS or not self.google_async_enabled:
+            return list(await asyncio.gather(
+                *(self.execute_tool_async(tool_name, params) for params in params_list)
+            ))
+        
+        results: List[Optional[str]] = [None] * len(params_list)
+        calls = self._prepare_batch(tool_name, params_list, results)
+        ready = list(calls)
+        chunks = [ready[start:start + TOOL_BATCH_SIZE] for start in range(0, len(ready), TOOL_BATCH_SIZE)]
+        await asyncio.gather(*(
+            self._send_batch_async(tool_name, params_list, calls, chunk, results) for chunk in chunks
+        ))
+        return results
+    
+    async def _send_batch_async(
+        self,
+        tool_name: str,
+        params_list: List[Dict[str, Any]],
+        calls: Dict[int, tuple],
+        chunk: List[int],
+        results: List[Optional[str]],
+    ) -> None:
+        if tool_name == 'send_email':
+            url = f"{GMAIL_API_URL}{GMAIL_BATCH_PATH}"
+        else:
+            url = f"{CALENDAR_API_URL}{CALENDAR_BATCH_PATH}"
+        content_type, content = encode_batch([(f"item-{index}", *calls[index]) for index in chunk])
+        
+        try:
+            headers = {**(await self._google_headers()), 'Content-Type': content_type}
+            response = await self._http_client('google').post(url, content=content, headers=headers)
+            response.raise_for_status()
+            responses = decode_batch(response.headers.get('content-type', ''), response.content)
+            logger.info(f"📦 Sent {len(chunk)} {tool_name} calls in one batch request")
+        except Exception as e:
+            for index in chunk:
+                results[index] = self._batch_failure(tool_name, e)
+            return
+        
+        for index in chunk:
+            status, data = responses.get(f"item-{index}", (500, {}))
+            if status < 300:
+                results[index] = self._batch_success(tool_name, params_list[index], data)
+            else:
+                results[index] = self._batch_failure(tool_name, batch_error_message(status, data))
 
 
 # Global instance
 _tool_executor = None
+_tool_executor_lock = threading.Lock()
 
 def get_tool_executor() -> ToolExecutor:
     """Get or create the global tool executor instance"""
     global _tool_executor
     if _tool_executor is None:
-        _tool_executor = ToolExecutor()
-        _tool_executor.initialize()
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                executor = ToolExecutor()
+                executor.initialize()
+                # Publish only once initialized so no caller sees a half-built executor
+                _tool_executor = executor
     return _tool_executor
 
+
+async def close_tool_executor() -> None:
+    """Close the executor's connection pools on the running loop (app shutdown)"""
+    if _tool_executor is not None:
+        await _tool_executor.aclose()
@@ -0,0 +1,93 @@
+"""
+Migrate trace documents to deterministic ids
+Older traces and spans were stored under random document ids; this rekeys them
+to users/{user_id}/agent_traces/{trace_id} and users/{user_id}/agent_spans/{span_id}
+
+Usage:
+    python -m factory.trace_migration [--user USER_ID] [--dry-run]
+"""
+
+import argparse
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = {
+    "agent_traces": "trace_id",
+    "agent_spans": "span_id",
+}
+BATCH_LIMIT = 400  # Each migrated document costs two writes (set + delete)
+
+
+def migrate_collection(db, user_id: str, collection_name: str, key_field: str, dry_run: bool = False) -> int:
+    """Rekey one user's collection; returns the number of documents moved"""
+    collection = db.collection('users').document(user_id).collection(collection_name)
+    moved = 0
+    batch = db.batch()
+    pending = 0
+    # Fields already staged per target id, since reads do not see uncommitted batch writes
+    staged: Dict[str, set] = {}
+
+    for snapshot in collection.stream():
+        data = snapshot.to_dict() or {}
+        key = data.get(key_field)
+        if not key or snapshot.id == key:
+            continue
+
+        moved += 1
+        if dry_run:
+            continue
+
+        # A document already under the new id is newer than the legacy copy:
+        # only fields it lacks are filled in, none of its values are overwritten
+        target = collection.document(str(key))
+        known = staged.get(str(key))
+        if known is None:
+            existing = target.get()
+            known = set((existing.to_dict() or {}) if existing.exists else {})
+        missing = {field: value for field, value in data.items() if field not in known}
+        if missing:
+            batch.set(target, missing, merge=True)
+        staged[str(key)] = known | set(missing)
+        batch.delete(snapshot.reference)
+        pending += 1
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+    return moved
+
+
+def migrate_legacy_documents(db, user_ids: Optional[List[str]] = None, dry_run: bool = False) -> Dict[str, int]:
+    """Rekey traces and spans for the given users, or for every user"""
+    if user_ids is None:
+        # list_documents also returns users that only have subcollections
+        user_ids = [ref.id for ref in db.collection('users').list_documents()]
+
+    totals = {name: 0 for name in COLLECTIONS}
+    for user_id in user_ids:
+        for collection_name, key_field in COLLECTIONS.items():
+            moved = migrate_collection(db, user_id, collection_name, key_field, dry_run)
+            totals[collection_name] += moved
+            if moved:
+                logger.info(f"{'Would move' if dry_run else 'Moved'} {moved} {collection_name} for user {user_id}")
+    return totals
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from factory.trace_stream import get_firestore_client
+
+    parser = argparse.ArgumentParser(description="Rekey trace documents by trace_id/span_id")
+    parser.add_argument("--user", action="append", dest="users", help="Only migrate this user (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Count documents without changing anything")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    totals = migrate_legacy_documents(get_firestore_client(), args.users, args.dry_run)
+    print(totals)
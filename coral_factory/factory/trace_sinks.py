@@ -0,0 +1,218 @@
+"""
+Trace sinks
+Storage backends behind the write-behind trace writer: Firestore, an
+append-only JSONL file and an indexed SQLite store
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_BACKEND = os.getenv("TRACE_BACKEND", "")  # firestore, jsonl, sqlite or none; empty = firestore if configured
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "traces.jsonl")
+TRACE_SQLITE_PATH = os.getenv("TRACE_SQLITE_PATH", "traces.sqlite")
+# Also look up legacy random-id documents by field before merging (migration window only)
+TRACE_LEGACY_LOOKUP = os.getenv("TRACE_LEGACY_LOOKUP", "false").lower() == "true"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class TraceSink:
+    """Interface for trace storage; write_batch is only called from the writer thread"""
+
+    name = "base"
+
+    def write_batch(self, writes: List[Any]) -> int:
+        """Persist the writes in order and return how many were written"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class FirestoreTraceSink(TraceSink):
+    """Firestore batched writes into users/{user_id}/{collection}/{key}"""
+
+    name = "firestore"
+
+    def __init__(self, db, legacy_lookup: bool = TRACE_LEGACY_LOOKUP, max_seen: int = 50000):
+        self.db = db
+        self.legacy_lookup = legacy_lookup
+        self.lookups = 0
+        # Documents already written, so create_fields are only sent once
+        self._seen: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._max_seen = max_seen
+
+    def write_batch(self, writes: List[Any]) -> int:
+        batch = self.db.batch()
+        # Documents are only "seen" once committed: a failed batch is retried with create_fields again
+        staged: "OrderedDict[tuple, Any]" = OrderedDict()
+        for write in writes:
+            self._stage(batch, write, staged)
+        batch.commit()
+
+        for seen_key, ref in staged.items():
+            self._seen[seen_key] = ref
+            self._seen.move_to_end(seen_key)
+        while len(self._seen) > self._max_seen:
+            self._seen.popitem(last=False)
+        return len(writes)
+
+    def _stage(self, batch, write, staged: "OrderedDict[tuple, Any]") -> None:
+        collection = self.db.collection('users').document(write.user_id).collection(write.collection)
+        seen_key = (write.collection, write.user_id, write.key)
+        known = seen_key in staged or seen_key in self._seen
+        ref = staged.get(seen_key) or self._seen.get(seen_key)
+
+        if ref is None:
+            ref = collection.document(write.key)
+            if self.legacy_lookup and write.mode == "merge":
+                ref = self._find_legacy(collection, write) or ref
+
+        if write.mode == "set":
+            batch.set(ref, {**write.create_fields, **write.data})
+        else:
+            data = {**(write.create_fields if not known else {}), **write.data}
+            data["updated_at"] = datetime.now(timezone.utc)
+            batch.set(ref, data, merge=True)
+
+        staged[seen_key] = ref
+
+    def _find_legacy(self, collection, write):
+        """Reference of a pre-migration document stored under a random id, if any"""
+        self.lookups += 1
+        docs = collection.where(write.key_field, '==', write.key).limit(1).get()
+        return docs[0].reference if docs else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "legacy_lookups": self.lookups}
+
+
+class JsonlTraceSink(TraceSink):
+    """Append-only JSON lines, one record per write; replay in order to rebuild documents"""
+
+    name = "jsonl"
+
+    def __init__(self, path: str = TRACE_JSONL_PATH):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write_batch(self, writes: List[Any]) -> int:
+        now = datetime.now(timezone.utc).isoformat()
+        lines = []
+        for write in writes:
+            record = {
+                "ts": now,
+                "collection": write.collection,
+                "user_id": write.user_id,
+                "key": write.key,
+                "mode": write.mode,
+                "data": write.data,
+            }
+            if write.create_fields:
+                record["create_fields"] = write.create_fields
+            lines.append(json.dumps(record, default=_json_default))
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        return len(writes)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path}
+
+
+class SqliteTraceSink(TraceSink):
+    """Current document state per trace/span, indexed by user and update time"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = TRACE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trace_documents ("
+            "collection TEXT NOT NULL, user_id TEXT NOT NULL, key TEXT NOT NULL, "
+            "data TEXT NOT NULL, updated_at TEXT NOT NULL, "
+            "PRIMARY KEY (collection, user_id, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS trace_documents_user_updated "
+            "ON trace_documents (user_id, collection, updated_at)"
+        )
+        self._conn.commit()
+
+    def write_batch(self, writes: List[Any]) -> int:
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            for write in writes:
+                document_key = (write.collection, write.user_id, write.key)
+                if write.mode == "set":
+                    document = {**write.create_fields, **write.data}
+                else:
+                    row = self._conn.execute(
+                        "SELECT data FROM trace_documents WHERE collection = ? AND user_id = ? AND key = ?",
+                        document_key,
+                    ).fetchone()
+                    document = json.loads(row[0]) if row else dict(write.create_fields)
+                    document.update(write.data)
+                    document["updated_at"] = now
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO trace_documents (collection, user_id, key, data, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (*document_key, json.dumps(document, default=_json_default), now),
+                )
+            self._conn.commit()
+        return len(writes)
+
+    def get(self, collection: str, user_id: str, key: str) -> Optional[Dict[str, Any]]:
+        """Read back one document (for tests and local tooling)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM trace_documents WHERE collection = ? AND user_id = ? AND key = ?",
+                (collection, user_id, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path}
+
+
+def create_trace_sink(backend: str = TRACE_BACKEND) -> Optional[TraceSink]:
+    """Build the configured sink; None when tracing is disabled"""
+    backend = (backend or "").lower()
+    if not backend:
+        configured = os.getenv("FIREBASE_PROJECT_ID") and os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
+        backend = "firestore" if configured else "none"
+
+    if backend == "none":
+        return None
+    if backend == "jsonl":
+        return JsonlTraceSink(TRACE_JSONL_PATH)
+    if backend == "sqlite":
+        return SqliteTraceSink(TRACE_SQLITE_PATH)
+    if backend == "firestore":
+        from factory.trace_stream import get_firestore_client
+        return FirestoreTraceSink(get_firestore_client())
+    raise ValueError(f"Unknown TRACE_BACKEND: {backend}")
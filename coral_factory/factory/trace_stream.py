@@ -1,11 +1,16 @@
 from agents import tracing  # type: ignore[import]
 from datetime import datetime, timezone
-from uuid import uuid4
 from typing import Optional
 import firebase_admin
 from firebase_admin import credentials, firestore
 import logging
 import os
+import threading
+import time
+
+from factory.trace_sinks import FirestoreTraceSink, TraceSink, create_trace_sink
+from factory.trace_writer import TraceWrite, get_trace_writer
+from factory.workflow_context import get_current_workflow
 
 required = (
     "TracingProcessor",
@@ -23,6 +28,21 @@ FIREBASE_SERVICE_ACCOUNT_PATH = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
 logger = logging.getLogger(__name__)
 
 
+def get_firestore_client(project_id: Optional[str] = None, service_account_path: Optional[str] = None):
+    """Initialize the Firebase Admin app once and return the Firestore client"""
+    project_id = project_id or FIREBASE_PROJECT_ID
+    service_account_path = service_account_path or FIREBASE_SERVICE_ACCOUNT_PATH
+    if not firebase_admin._apps:
+        if service_account_path:
+            cred = credentials.Certificate(service_account_path)
+            firebase_admin.initialize_app(cred, {
+                'projectId': project_id
+            })
+        else:
+            # Use default credentials (for Cloud Run, etc.)
+            firebase_admin.initialize_app()
+    return firestore.client()
+
 
 class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no-redef]
         """Tracing processor for the `OpenAI Agents SDK <https://openai.github.io/openai-agents-python/>`_.
@@ -37,9 +57,11 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
             metadata: Optional[dict] = None,
             tags: Optional[list[str]] = None,
             name: Optional[str] = None,
+            sink: Optional[TraceSink] = None,
         ):
             self.firebase_project_id = firebase_project_id or FIREBASE_PROJECT_ID
             self.firebase_service_account_path = firebase_service_account_path or FIREBASE_SERVICE_ACCOUNT_PATH
+            # Default user; a shared processor scopes each call to the workflow's user
             self.user_id = user_id or os.getenv("USER_ID", "anonymous")
             self._metadata = metadata or {}
             self._tags = tags or []
@@ -47,23 +69,15 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
             self._first_response_inputs: dict = {}
             self._last_response_outputs: dict = {}
             
-            # Initialize Firebase Admin SDK
-            try:
-                if not firebase_admin._apps:
-                    if self.firebase_service_account_path:
-                        cred = credentials.Certificate(self.firebase_service_account_path)
-                        firebase_admin.initialize_app(cred, {
-                            'projectId': self.firebase_project_id
-                        })
-                    else:
-                        # Use default credentials (for Cloud Run, etc.)
-                        firebase_admin.initialize_app()
-                
-                self.db = firestore.client()
-                logger.info("Successfully connected to Firebase Firestore")
-            except Exception as e:
-                logger.error(f"Failed to connect to Firebase Firestore: {e}")
-                raise
+            if sink is None:
+                # Initialize Firebase Admin SDK
+                try:
+                    sink = FirestoreTraceSink(get_firestore_client(self.firebase_project_id, self.firebase_service_account_path))
+                    logger.info("Successfully connected to Firebase Firestore")
+                except Exception as e:
+                    logger.error(f"Failed to connect to Firebase Firestore: {e}")
+                    raise
+            self.writer = get_trace_writer(sink)
 
             self._active_traces: dict[str, dict] = {}
             self._active_spans: dict[str, dict] = {}
@@ -79,10 +93,10 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
             else:
                 trace_name = "Agent workflow"
             
-            trace_id = str(uuid4())
             start_time = datetime.now(timezone.utc)
             
             trace_dict = trace.export() or {}
+            user_id = self._resolve_user_id()
             
             trace_document = {
                 "trace_id": trace.trace_id,
@@ -100,17 +114,16 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
                 "outputs": {},
                 "created_at": start_time,
                 "updated_at": start_time,
-                "user_id": self.user_id,
+                "user_id": user_id,
             }
             
-            try:
-                # Store in users/{user_id}/agent_traces/{trace_id}
-                trace_ref = self.db.collection('users').document(self.user_id).collection('agent_traces').document(trace_id)
-                trace_ref.set(trace_document)
-                self._active_traces[trace.trace_id] = trace_document
-                logger.debug(f"Started trace: {trace.trace_id}")
-            except Exception as e:
-                logger.exception(f"Error creating trace in Firestore: {e}")
+            # Store in users/{user_id}/agent_traces/{trace_id} (written behind)
+            self.writer.enqueue(TraceWrite(
+                'agent_traces', user_id, 'trace_id', trace.trace_id,
+                trace_document, mode="set",
+            ))
+            self._active_traces[trace.trace_id] = trace_document
+            logger.debug(f"Started trace: {trace.trace_id}")
 
         def on_trace_end(self, trace: tracing.Trace) -> None:
             """End a trace and update it in Firestore."""
@@ -137,22 +150,12 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
                 "updated_at": end_time,
             }
             
-            try:
-                # Find the trace document to update
-                trace_doc = self._active_traces[trace.trace_id]
-                if "trace_id" in trace_doc:
-                    # Update the trace using a query to find the document by trace_id
-                    traces_ref = self.db.collection('users').document(self.user_id).collection('agent_traces')
-                    docs = traces_ref.where('trace_id', '==', trace.trace_id).get()
-                    
-                    for doc in docs:
-                        doc.reference.update(update_data)
-                        break
-                
-                self._active_traces.pop(trace.trace_id, None)
-                logger.debug(f"Completed trace: {trace.trace_id}")
-            except Exception as e:
-                logger.exception(f"Error updating trace in Firestore: {e}")
+            trace_doc = self._active_traces.pop(trace.trace_id)
+            self.writer.enqueue(TraceWrite(
+                'agent_traces', trace_doc["user_id"], 'trace_id', trace.trace_id,
+                update_data, mode="merge",
+            ))
+            logger.debug(f"Completed trace: {trace.trace_id}")
 
         def on_span_start(self, span: tracing.Span) -> None:
             """Start a new span and store it in Firestore."""
@@ -160,7 +163,6 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
                 logger.warning(f"Parent trace {span.trace_id} not found for span {span.span_id}")
                 return
                 
-            span_id = str(uuid4())
             start_time = (
                 datetime.fromisoformat(span.started_at)
                 if span.started_at
@@ -190,17 +192,16 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
                 "tags": self._tags,
                 "created_at": start_time,
                 "updated_at": start_time,
-                "user_id": self.user_id,
+                "user_id": self._active_traces[span.trace_id]["user_id"],
             }
             
-            try:
-                # Store in users/{user_id}/agent_spans/{span_id}
-                span_ref = self.db.collection('users').document(self.user_id).collection('agent_spans').document(span_id)
-                span_ref.set(span_document)
-                self._active_spans[span.span_id] = span_document
-                logger.debug(f"Started span: {span.span_id}")
-            except Exception as e:
-                logger.exception(f"Error creating span in Firestore: {e}")
+            # Store in users/{user_id}/agent_spans/{span_id} (written behind)
+            self.writer.enqueue(TraceWrite(
+                'agent_spans', span_document["user_id"], 'span_id', span.span_id,
+                span_document, mode="set",
+            ))
+            self._active_spans[span.span_id] = span_document
+            logger.debug(f"Started span: {span.span_id}")
 
         def on_span_end(self, span: tracing.Span) -> None:
             """End a span and update it in Firestore."""
@@ -233,19 +234,12 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
                 )
                 self._last_response_outputs[span.trace_id] = outputs
             
-            try:
-                # Find the span document to update
-                spans_ref = self.db.collection('users').document(self.user_id).collection('agent_spans')
-                docs = spans_ref.where('span_id', '==', span.span_id).get()
-                
-                for doc in docs:
-                    doc.reference.update(update_data)
-                    break
-                
-                self._active_spans.pop(span.span_id, None)
-                logger.debug(f"Completed span: {span.span_id}")
-            except Exception as e:
-                logger.exception(f"Error updating span in Firestore: {e}")
+            span_doc = self._active_spans.pop(span.span_id)
+            self.writer.enqueue(TraceWrite(
+                'agent_spans', span_doc["user_id"], 'span_id', span.span_id,
+                update_data, mode="merge",
+            ))
+            logger.debug(f"Completed span: {span.span_id}")
 
         def _extract_span_inputs(self, span: tracing.Span) -> dict:
             """Extract inputs from span data."""
@@ -276,78 +270,82 @@ class OpenAIAgentsTracingProcessor(tracing.TracingProcessor):  # type: ignore[no
                 return {}
 
         def shutdown(self) -> None:
-            """Clean up Firebase connection."""
+            """Flush buffered writes; the shared writer itself stops at app shutdown."""
             try:
-                # Firebase Admin SDK doesn't require explicit connection closing
+                self.writer.flush()
                 logger.debug("Firebase connection cleaned up")
             except Exception as e:
                 logger.exception(f"Error cleaning up Firebase connection: {e}")
 
         def force_flush(self) -> None:
             """Force flush any pending operations."""
-            # Firestore operations are synchronous by default, so no explicit flush needed
-            pass
+            self.writer.flush()
         
-        async def save_trace(self, trace_data: dict) -> None:
-            """Save or update a trace directly (for SimpleLiteLLMAgent)"""
-            try:
-                trace_id = trace_data["trace_id"]
-                
-                # Check if trace already exists
-                traces_ref = self.db.collection('users').document(self.user_id).collection('agent_traces')
-                existing_docs = traces_ref.where('trace_id', '==', trace_id).limit(1).get()
-                
-                if existing_docs:
-                    # Update existing trace
-                    for doc in existing_docs:
-                        doc.reference.update({
-                            **trace_data,
-                            "updated_at": datetime.now(timezone.utc),
-                        })
-                        logger.info(f"Updated trace: {trace_id}")
-                        break
-                else:
-                    # Create new trace
-                    trace_document = {
-                        **trace_data,
-                        "created_at": datetime.now(timezone.utc),
-                        "updated_at": datetime.now(timezone.utc),
-                        "user_id": self.user_id,
-                    }
-                    traces_ref.document().set(trace_document)
-                    logger.info(f"Created trace: {trace_id}")
-                    
-            except Exception as e:
-                logger.error(f"Failed to save trace: {e}")
+        def _resolve_user_id(self, user_id: Optional[str] = None) -> str:
+            """Explicit user, else the running workflow's user, else the processor default"""
+            if user_id:
+                return user_id
+            workflow = get_current_workflow()
+            return workflow.user_id if workflow else self.user_id
+
+        async def save_trace(self, trace_data: dict, user_id: Optional[str] = None) -> None:
+            """Save or update a trace directly (for SimpleLiteLLMAgent), written behind"""
+            user_id = self._resolve_user_id(user_id)
+            now = datetime.now(timezone.utc)
+            self.writer.enqueue(TraceWrite(
+                'agent_traces', user_id, 'trace_id', trace_data["trace_id"],
+                trace_data, mode="merge",
+                create_fields={"created_at": now, "updated_at": now, "user_id": user_id},
+            ))
         
-        async def save_span(self, span_data: dict) -> None:
-            """Save or update a span directly (for SimpleLiteLLMAgent)"""
-            try:
-                span_id = span_data["span_id"]
-                
-                # Check if span already exists
-                spans_ref = self.db.collection('users').document(self.user_id).collection('agent_spans')
-                existing_docs = spans_ref.where('span_id', '==', span_id).limit(1).get()
-                
-                if existing_docs:
-                    # Update existing span
-                    for doc in existing_docs:
-                        doc.reference.update({
-                            **span_data,
-                            "updated_at": datetime.now(timezone.utc),
-                        })
-                        logger.info(f"Updated span: {span_id}")
-                        break
-                else:
-                    # Create new span
-                    span_document = {
-                        **span_data,
-                        "created_at": datetime.now(timezone.utc),
-                        "updated_at": datetime.now(timezone.utc),
-                        "user_id": self.user_id,
-                    }
-                    spans_ref.document().set(span_document)
-                    logger.info(f"Created span: {span_id}")
-                    
-            except Exception as e:
-                logger.error(f"Failed to save span: {e}")
\ No newline at end of file
+        async def save_span(self, span_data: dict, user_id: Optional[str] = None) -> None:
+            """Save or update a span directly (for SimpleLiteLLMAgent), written behind"""
+            user_id = self._resolve_user_id(user_id)
+            now = datetime.now(timezone.utc)
+            self.writer.enqueue(TraceWrite(
+                'agent_spans', user_id, 'span_id', span_data["span_id"],
+                span_data, mode="merge",
+                create_fields={"created_at": now, "updated_at": now, "user_id": user_id},
+            ))
+
+
+# Global instance, shared by every workflow
+_tracing_processor: Optional[OpenAIAgentsTracingProcessor] = None
+_tracing_initialized = False
+_tracing_lock = threading.Lock()
+_tracing_stats = {"enabled": False, "backend": None, "startup_ms": None}
+
+def init_tracing() -> Optional[OpenAIAgentsTracingProcessor]:
+    """Create the shared tracing processor once (called at app startup)"""
+    global _tracing_processor, _tracing_initialized
+    with _tracing_lock:
+        if _tracing_initialized:
+            return _tracing_processor
+        _tracing_initialized = True
+
+        start = time.perf_counter()
+        try:
+            sink = create_trace_sink()
+            if sink is None:
+                logger.warning("No trace backend configured - traces will not be saved!")
+                return None
+            _tracing_processor = OpenAIAgentsTracingProcessor(sink=sink)
+        except Exception as e:
+            logger.error(f"Failed to create tracer: {e}")
+            return None
+        _tracing_stats["enabled"] = True
+        _tracing_stats["backend"] = sink.name
+        _tracing_stats["startup_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"Tracing processor created in {_tracing_stats['startup_ms']}ms ({sink.name})")
+        return _tracing_processor
+
+
+def get_tracing_processor() -> Optional[OpenAIAgentsTracingProcessor]:
+    """The shared tracing processor, or None when tracing is not configured"""
+    if not _tracing_initialized:
+        return init_tracing()
+    return _tracing_processor
+
+
+def tracing_stats() -> dict:
+    return dict(_tracing_stats)
@@ -0,0 +1,208 @@
+"""
+Write-behind trace writer
+Collects trace and span writes in a bounded queue and hands them to the
+configured trace sink in batches from a background thread
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from factory.trace_sinks import TraceSink
+
+logger = logging.getLogger(__name__)
+
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_BATCH_SIZE = min(int(os.getenv("TRACE_BATCH_SIZE", "200")), 500)  # Firestore batch limit is 500
+TRACE_FLUSH_INTERVAL_SECONDS = float(os.getenv("TRACE_FLUSH_INTERVAL_SECONDS", "1.0"))
+TRACE_DROP_POLICY = os.getenv("TRACE_DROP_POLICY", "drop_newest")  # "drop_newest" or "drop_oldest"
+
+DROP_POLICIES = ("drop_newest", "drop_oldest")
+
+
+class TraceWrite:
+    """
+    One buffered document write, keyed by the trace or span id itself.
+
+    mode:
+        set   - write the whole document (start of a trace or span)
+        merge - set(merge=True) into the document; create_fields are added
+                the first time this writer touches the document
+    """
+
+    __slots__ = ("collection", "user_id", "key_field", "key", "data", "mode", "create_fields")
+
+    def __init__(
+        self,
+        collection: str,
+        user_id: str,
+        key_field: str,
+        key: str,
+        data: Dict[str, Any],
+        mode: str = "merge",
+        create_fields: Optional[Dict[str, Any]] = None,
+    ):
+        self.collection = collection
+        self.user_id = user_id
+        self.key_field = key_field
+        self.key = key
+        self.data = data
+        self.mode = mode
+        self.create_fields = create_fields or {}
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BatchedTraceWriter:
+    """Bounded write-behind buffer flushed on size, time and shutdown"""
+
+    def __init__(
+        self,
+        sink: TraceSink,
+        max_queue: int = TRACE_QUEUE_SIZE,
+        batch_size: int = TRACE_BATCH_SIZE,
+        flush_interval: float = TRACE_FLUSH_INTERVAL_SECONDS,
+        drop_policy: str = TRACE_DROP_POLICY,
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {drop_policy}, expected one of {DROP_POLICIES}")
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    # ==================== PRODUCER SIDE ====================
+
+    def enqueue(self, write: TraceWrite) -> bool:
+        """Buffer a write without blocking; returns False if it was dropped"""
+        if self._stop.is_set():
+            self._count("dropped")
+            return False
+        try:
+            self._queue.put_nowait(write)
+        except queue.Full:
+            if self.drop_policy == "drop_oldest":
+                try:
+                    self._queue.get_nowait()
+                    self._count("dropped")
+                    self._queue.put_nowait(write)
+                except (queue.Empty, queue.Full):
+                    self._count("dropped")
+                    return False
+            else:
+                self._count("dropped")
+                return False
+        self._count("enqueued")
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until everything queued so far is written"""
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush remaining writes and stop the background thread"""
+        if self._stop.is_set():
+            return
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+        try:
+            self.sink.close()
+        except Exception as e:
+            logger.error(f"Failed to close trace sink: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                **self._stats,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "drop_policy": self.drop_policy,
+                "sink": self.sink.stats(),
+            }
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    # ==================== BACKGROUND THREAD ====================
+
+    def _run(self) -> None:
+        pending: List[TraceWrite] = []
+        deadline = time.monotonic() + self.flush_interval
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _FlushMarker):
+                self._write_batch(pending)
+                pending = []
+                item.done.set()
+            elif item is not None:
+                pending.append(item)
+
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._write_batch(pending)
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+
+        self._write_batch(pending)
+
+    def _write_batch(self, writes: List[TraceWrite]) -> None:
+        if not writes:
+            return
+        try:
+            written = self.sink.write_batch(writes)
+            self._count("written", written)
+            self._count("batches")
+        except Exception as e:
+            logger.error(f"Failed to write {len(writes)} trace documents to {self.sink.name}: {e}")
+            self._count("failed", len(writes))
+
+
+# Global instance
+_trace_writer: Optional[BatchedTraceWriter] = None
+_trace_writer_lock = threading.Lock()
+
+def get_trace_writer(sink: TraceSink) -> BatchedTraceWriter:
+    """Get or create the process-wide trace writer (the first sink wins)"""
+    global _trace_writer
+    if _trace_writer is None:
+        with _trace_writer_lock:
+            if _trace_writer is None:
+                _trace_writer = BatchedTraceWriter(sink)
+                logger.info(f"✅ Trace writer started ({sink.name})")
+    return _trace_writer
+
+
+def peek_trace_writer() -> Optional[BatchedTraceWriter]:
+    """The trace writer if one was started, without creating it"""
+    return _trace_writer
+
+
+def shutdown_trace_writer(timeout: float = 10.0) -> None:
+    """Flush and stop the process-wide trace writer"""
+    if _trace_writer is not None:
+        _trace_writer.close(timeout)
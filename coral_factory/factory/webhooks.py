@@ -0,0 +1,437 @@
+"""
+Completion webhooks
+Background dispatcher that POSTs finished workflows to their callback URL over
+pooled connections, with bounded concurrency, exponential-backoff retries and a
+dead-letter log for deliveries that never succeed
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+import httpcore
+import httpx
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "1"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "300"))
+WEBHOOK_DEAD_LETTER_PATH = os.getenv(
+    "WEBHOOK_DEAD_LETTER_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "webhook_dead_letter.jsonl"),
+)
+# Past this size the dead-letter file is rotated to <path>.1 (the previous .1 is dropped)
+WEBHOOK_DEAD_LETTER_MAX_BYTES = int(os.getenv("WEBHOOK_DEAD_LETTER_MAX_BYTES", str(50 * 1024 * 1024)))
+WEBHOOK_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT_SECONDS", "10"))
+# Optional shared secret; deliveries then carry an HMAC-SHA256 signature of the body
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Callback hosts accepted even though they resolve to internal addresses (comma-separated)
+WEBHOOK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+# Development only: accept loopback/private callbacks, e.g. benchmarks.webhook_receiver
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() == "true"
+
+# Client errors worth retrying; any other 4xx goes straight to the dead-letter log
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+
+def validate_callback_url(url: str) -> str:
+    """Only absolute http(s) URLs are accepted as callbacks"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url must be an absolute http(s) URL")
+    return url
+
+
+def _is_internal_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    # Loopback, RFC 1918, link-local (cloud metadata), CGNAT, unspecified, reserved and multicast
+    return not ip.is_global or ip.is_multicast
+
+
+async def _resolve(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+async def resolve_callback_host(
+    host: str,
+    port: int,
+    allow_private: bool = WEBHOOK_ALLOW_PRIVATE,
+    allowed_hosts: frozenset = WEBHOOK_ALLOWED_HOSTS,
+) -> List[str]:
+    """
+    Addresses to connect to for a callback host, refusing internal ones so
+    callers cannot make the server POST results to itself or its network.
+    Allowlisted hosts (and everything with allow_private) come back unresolved.
+
+    Raises ValueError for a refused host and OSError when it does not resolve.
+    """
+    host = host.lower()
+    if allow_private or host in allowed_hosts:
+        return [host]
+    addresses = await _resolve(host, port)
+    for address in addresses:
+        if _is_internal_address(address):
+            raise ValueError(f"callback_url host {host} resolves to an internal address")
+    return addresses
+
+
+async def check_callback_target(
+    url: str,
+    allow_private: bool = WEBHOOK_ALLOW_PRIVATE,
+    allowed_hosts: frozenset = WEBHOOK_ALLOWED_HOSTS,
+) -> None:
+    """Early answer for request validation; deliveries are checked again when they connect"""
+    parsed = urlparse(validate_callback_url(url))
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    await resolve_callback_host(parsed.hostname, port, allow_private, allowed_hosts)
+
+
+class _CheckedNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    Resolves the host itself and connects to an address it just checked, so a
+    DNS answer that changes between the check and the connect (rebinding)
+    cannot point a delivery at an internal address. TLS still verifies the hostname.
+    """
+
+    def __init__(self, allow_private: bool, allowed_hosts: frozenset, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self.allow_private = allow_private
+        self.allowed_hosts = allowed_hosts
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = await asyncio.wait_for(
+            resolve_callback_host(host, port, self.allow_private, self.allowed_hosts), timeout
+        )
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("unix sockets are not callback targets")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class CheckedTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that only opens connections to checked callback addresses"""
+
+    def __init__(
+        self,
+        allow_private: bool = WEBHOOK_ALLOW_PRIVATE,
+        allowed_hosts: frozenset = WEBHOOK_ALLOWED_HOSTS,
+        limits: httpx.Limits = httpx.Limits(),
+        network_backend: Optional[httpcore.AsyncNetworkBackend] = None,
+    ):
+        super().__init__(limits=limits)
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=_CheckedNetworkBackend(allow_private, allowed_hosts, network_backend),
+        )
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+@dataclass
+class Delivery:
+    url: str
+    payload: Dict[str, Any]
+    delivery_id: str
+    attempts: int = 0
+    last_error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+class WebhookDispatcher:
+    """
+    Fixed pool of async workers draining a bounded delivery queue.
+
+    A failed attempt is re-queued after an exponential backoff (with jitter,
+    honouring Retry-After) instead of holding a worker while it waits.
+    Deliveries that exhaust their attempts, get a non-retryable answer or do
+    not fit in the queue are appended to the dead-letter JSONL file.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+        backoff_base_s: float = WEBHOOK_BACKOFF_BASE_SECONDS,
+        backoff_max_s: float = WEBHOOK_BACKOFF_MAX_SECONDS,
+        timeout_s: float = WEBHOOK_TIMEOUT_SECONDS,
+        dead_letter_path: Optional[str] = WEBHOOK_DEAD_LETTER_PATH,
+        dead_letter_max_bytes: int = WEBHOOK_DEAD_LETTER_MAX_BYTES,
+        secret: Optional[str] = WEBHOOK_SECRET,
+        allow_private: bool = WEBHOOK_ALLOW_PRIVATE,
+        allowed_hosts: frozenset = WEBHOOK_ALLOWED_HOSTS,
+        network_backend: Optional[httpcore.AsyncNetworkBackend] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.timeout_s = timeout_s
+        self.dead_letter_path = dead_letter_path
+        self.dead_letter_max_bytes = dead_letter_max_bytes
+        self.secret = secret
+        self.allow_private = allow_private
+        self.allowed_hosts = allowed_hosts
+        self.network_backend = network_backend
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: Dict[asyncio.Task, Delivery] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._dead_letter_lock = threading.Lock()
+        self._dead_letter_writes: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._stats = {"enqueued": 0, "delivered": 0, "attempts": 0, "retries": 0, "dead_lettered": 0}
+        self._total_delivery_s = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Create the queue, HTTP client and workers on the running event loop"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout_s,
+            transport=CheckedTransport(self.allow_private, self.allowed_hosts, limits, self.network_backend),
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{index}")
+            for index in range(self.max_concurrency)
+        ]
+        logger.info(f"Webhook dispatcher started ({self.max_concurrency} workers, queue size {self.queue_size})")
+
+    async def stop(self, timeout: float = WEBHOOK_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Give queued deliveries `timeout` seconds, then dead-letter whatever is left"""
+        if not self._workers:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._queue.qsize() or self._in_flight or self._retries) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        retries, self._retries = self._retries, {}
+        for task, delivery in retries.items():
+            task.cancel()
+            self._dead_letter(delivery, f"shutdown before retry ({delivery.last_error})")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*retries, *self._workers, return_exceptions=True)
+        self._workers = []
+
+        while not self._queue.empty():
+            self._dead_letter(self._queue.get_nowait(), "shutdown")
+        await self._client.aclose()
+        await asyncio.gather(*self._dead_letter_writes, return_exceptions=True)
+        logger.info("Webhook dispatcher stopped")
+
+    async def check_url(self, url: str) -> None:
+        """check_callback_target with this dispatcher's allowlist"""
+        await check_callback_target(url, self.allow_private, self.allowed_hosts)
+
+    def enqueue(self, url: str, payload: Dict[str, Any], delivery_id: str) -> bool:
+        """Schedule a delivery; False (and dead-lettered) when it cannot be queued"""
+        delivery = Delivery(url=url, payload=payload, delivery_id=delivery_id)
+        if self._queue is None:
+            self._dead_letter(delivery, "dispatcher not started")
+            return False
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            logger.warning(f"Webhook queue full ({self.queue_size}), dead-lettering {delivery_id}")
+            self._dead_letter(delivery, "queue full")
+            return False
+        self._stats["enqueued"] += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            delivery = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._attempt(delivery)
+            except asyncio.CancelledError:
+                self._dead_letter(delivery, "shutdown during delivery")
+                raise
+            except Exception as e:
+                logger.error(f"Webhook worker error for {delivery.delivery_id}: {e}")
+                self._dead_letter(delivery, f"{type(e).__name__}: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _attempt(self, delivery: Delivery) -> None:
+        body = json.dumps(delivery.payload, default=str).encode()
+        headers = {
+            "Content-Type": "application/json",
+            # Stable across retries, so receivers can deduplicate
+            "X-Factory-Delivery": delivery.delivery_id,
+            "X-Factory-Attempt": str(delivery.attempts + 1),
+        }
+        if self.secret:
+            headers["X-Factory-Signature"] = sign_payload(body, self.secret)
+
+        delivery.attempts += 1
+        self._stats["attempts"] += 1
+        start = time.monotonic()
+        retry_after = None
+        try:
+            # The transport checks the addresses it connects to, whatever DNS says by now
+            response = await self._client.post(delivery.url, content=body, headers=headers)
+        except ValueError as e:
+            retryable, delivery.last_error = False, str(e)
+        except (httpx.HTTPError, OSError) as e:
+            retryable, delivery.last_error = True, f"{type(e).__name__}: {e}"
+        except Exception as e:
+            # e.g. httpx.InvalidURL: retrying cannot help, but the delivery must not vanish
+            retryable, delivery.last_error = False, f"{type(e).__name__}: {e}"
+        else:
+            if response.status_code < 300:
+                self._stats["delivered"] += 1
+                self._total_delivery_s += time.monotonic() - start
+                logger.info(f"📬 Webhook delivered: {delivery.delivery_id} (attempt {delivery.attempts})")
+                return
+            retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUS
+            delivery.last_error = f"HTTP {response.status_code}"
+            retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+
+        if not retryable or delivery.attempts >= self.max_attempts:
+            self._dead_letter(delivery, delivery.last_error)
+            return
+        delay = retry_after if retry_after is not None else self._backoff(delivery.attempts)
+        logger.warning(f"⚠️ Webhook {delivery.delivery_id} failed ({delivery.last_error}), retry in {delay:.1f}s")
+        self._stats["retries"] += 1
+        task = asyncio.create_task(self._requeue_later(delivery, min(delay, self.backoff_max_s)))
+        self._retries[task] = delivery
+        task.add_done_callback(lambda done: self._retries.pop(done, None))
+
+    def _backoff(self, attempts: int) -> float:
+        """Exponential backoff with full jitter"""
+        ceiling = min(self.backoff_max_s, self.backoff_base_s * (2 ** (attempts - 1)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def _requeue_later(self, delivery: Delivery, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            self._dead_letter(delivery, f"queue full on retry ({delivery.last_error})")
+
+    def _dead_letter(self, delivery: Delivery, reason: Optional[str]) -> None:
+        self._stats["dead_lettered"] += 1
+        logger.error(f"❌ Webhook {delivery.delivery_id} dead-lettered after {delivery.attempts} attempts: {reason}")
+        if not self.dead_letter_path:
+            return
+        record = {
+            "delivery_id": delivery.delivery_id,
+            "url": delivery.url,
+            "attempts": delivery.attempts,
+            "reason": reason,
+            "created_at": delivery.created_at,
+            "dead_lettered_at": time.time(),
+            "payload": delivery.payload,
+        }
+        try:
+            line = json.dumps(record, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Failed to write webhook dead letter: {e}")
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_dead_letter(line)
+            return
+        # Disk IO (and rotation) runs in a thread so a slow disk does not stall the event loop
+        task = loop.create_task(asyncio.to_thread(self._write_dead_letter, line))
+        self._dead_letter_writes.add(task)
+        task.add_done_callback(self._dead_letter_writes.discard)
+
+    def _write_dead_letter(self, line: str) -> None:
+        try:
+            self._append_dead_letter(line)
+        except OSError as e:
+            logger.error(f"Failed to write webhook dead letter: {e}")
+
+    def _append_dead_letter(self, line: str) -> None:
+        """Append one record, rotating the file past dead_letter_max_bytes; owner-only since it holds results"""
+        path = self.dead_letter_path
+        with self._dead_letter_lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.dead_letter_max_bytes and os.path.exists(path) and os.path.getsize(path) + len(line) > self.dead_letter_max_bytes:
+                os.replace(path, path + ".1")
+                logger.warning(f"⚠️ Webhook dead-letter file rotated to {path}.1")
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            with os.fdopen(fd, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "waiting_retry": len(self._retries),
+            "avg_delivery_ms": round(self._total_delivery_s * 1000 / max(self._stats["delivered"], 1), 2),
+            "dead_letter_path": self.dead_letter_path,
+        }
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds (the HTTP-date form is ignored)"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+# Global instance
+_webhook_dispatcher: Optional[WebhookDispatcher] = None
+_webhook_dispatcher_lock = threading.Lock()
+
+def get_webhook_dispatcher() -> WebhookDispatcher:
+    """Get or create the process-wide webhook dispatcher"""
+    global _webhook_dispatcher
+    if _webhook_dispatcher is None:
+        with _webhook_dispatcher_lock:
+            if _webhook_dispatcher is None:
+                _webhook_dispatcher = WebhookDispatcher()
+    return _webhook_dispatcher
@@ -0,0 +1,133 @@
+"""
+Compiled workflow cache
+Keeps the run-independent parts of a workflow (agent prompts, tool switches,
+manager overview, DAG order) keyed by a stable hash of its config
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from factory.dag import validate_dag
+from factory.simple_agent import CompiledAgent, SimpleLiteLLMAgent, compile_simple_agent
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_CACHE_SIZE = int(os.getenv("WORKFLOW_CACHE_SIZE", "512"))
+
+
+def workflow_cache_key(workflow_config: Any) -> str:
+    """Stable hash of a WorkflowConfig, ignoring the API key"""
+    payload = workflow_config.model_dump(mode="json", exclude={"api_key"})
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class CompiledWorkflow:
+    """Everything builder() used to redo on every run"""
+
+    def __init__(self, key: str, agents: List[CompiledAgent], overview: str, dag_dependencies: Optional[Dict[str, List[str]]] = None):
+        self.key = key
+        self.agents = agents
+        self.overview = overview
+        self.dag_dependencies = dag_dependencies
+
+    def instantiate(self, api_key: str, user_id: str, tracer: list = None, date_only: bool = False) -> Dict[str, SimpleLiteLLMAgent]:
+        """Fresh per-run agents with their own conversation history (date_only: see CompiledAgent.instantiate)"""
+        if date_only:
+            context = {"__system__": f"The date is {datetime.now().strftime('%Y-%m-%d')}"}
+        else:
+            context = {"__system__": f"The time is {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"}
+        return {
+            compiled.name: compiled.instantiate(
+                api_key=api_key, user_id=user_id, context=context, tracer=tracer, date_only=date_only
+            )
+            for compiled in self.agents
+        }
+
+
+def compile_workflow(workflow_config: Any, key: Optional[str] = None) -> CompiledWorkflow:
+    """Build the run-independent parts of a workflow"""
+    # Build overview for manager agent
+    overview = "You are a manager agent. Solve the user's task by delegating tasks to the appropriate agents and delegating the tasks to them.\n"
+    overview += "Think step by step and do not ask the user for clarification, just execute the task as best as you can."
+    overview += "You have access to the following agents:\n"
+
+    for agent in workflow_config.agents:
+        overview += f"{agent.name}: {agent.persona}\n"
+
+    dag_dependencies = None
+    if workflow_config.relations_type == "dag":
+        dag_dependencies = validate_dag(workflow_config.agents)
+
+    agents = [
+        compile_simple_agent(
+            agent_name=agent.name,
+            model_name=workflow_config.model_name,
+            toolkits=agent.toolkits,
+            persona=agent.persona,
+            output=agent.output,
+            guidelines=agent.guidelines,
+        )
+        for agent in workflow_config.agents
+    ]
+    return CompiledWorkflow(key or workflow_cache_key(workflow_config), agents, overview, dag_dependencies)
+
+
+class WorkflowCache:
+    """Bounded LRU of compiled workflows"""
+
+    def __init__(self, max_entries: int = WORKFLOW_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledWorkflow]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, workflow_config: Any) -> CompiledWorkflow:
+        key = workflow_cache_key(workflow_config)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return compiled
+
+        # Invalid configs raise here and are never cached
+        compiled = compile_workflow(workflow_config, key)
+        with self._lock:
+            self._misses += 1
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Global instance
+_workflow_cache: Optional[WorkflowCache] = None
+_workflow_cache_lock = threading.Lock()
+
+def get_workflow_cache() -> WorkflowCache:
+    """Get or create the process-wide compiled workflow cache"""
+    global _workflow_cache
+    if _workflow_cache is None:
+        with _workflow_cache_lock:
+            if _workflow_cache is None:
+                _workflow_cache = WorkflowCache(WORKFLOW_CACHE_SIZE)
+    return _workflow_cache
@@ -0,0 +1,33 @@
+"""
+Per-workflow context
+Carries the running workflow's identity and counters through every task it spawns
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class WorkflowContext:
+    trace_id: str
+    user_id: str
+    cache_completions: bool = False
+    stats: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    events: Optional[Any] = None  # WorkflowEventBus, when progress is streamed
+
+    def record(self, group: str, metric: str, count: int = 1) -> None:
+        counters = self.stats.setdefault(group, {})
+        counters[metric] = counters.get(metric, 0) + count
+
+    def record_timing(self, name: str, elapsed_ms: float) -> None:
+        self.timings_ms[name] = round(self.timings_ms.get(name, 0.0) + elapsed_ms, 3)
+
+
+current_workflow: ContextVar[Optional[WorkflowContext]] = ContextVar("current_workflow", default=None)
+
+
+def get_current_workflow() -> Optional[WorkflowContext]:
+    """Context of the workflow running in this task, if any"""
+    return current_workflow.get()
@@ -0,0 +1,129 @@
+"""
+Per-workflow event bus
+Agent, tool and token events of one workflow, replayable by sequence number so
+stream subscribers can join late or reconnect with Last-Event-ID
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from factory.workflow_context import get_current_workflow
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_EVENT_BUFFER = int(os.getenv("WORKFLOW_EVENT_BUFFER", "5000"))
+WORKFLOW_STREAM_HEARTBEAT_SECONDS = float(os.getenv("WORKFLOW_STREAM_HEARTBEAT_SECONDS", "15"))
+
+
+class WorkflowEventBus:
+    """
+    Append-only, bounded event log for one workflow.
+
+    publish() may be called from any thread (tool workers emit too); each
+    subscriber waits on a future tied to its own event loop, like
+    ConcurrencyLimiter does. When the buffer overflows the oldest events
+    are dropped and late subscribers get a "gap" event instead.
+    """
+
+    def __init__(self, trace_id: str, max_events: int = WORKFLOW_EVENT_BUFFER):
+        self.trace_id = trace_id
+        self._events: deque = deque(maxlen=max_events)
+        self._next_id = 1
+        self._closed = False
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def publish(self, event_type: str, **data: Any) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            event = {"id": self._next_id, "type": event_type, "time": time.time(), **data}
+            self._next_id += 1
+            self._events.append(event)
+            self._wake_waiters_locked()
+
+    def close(self) -> None:
+        """No more events; subscribers finish once they have drained the buffer"""
+        with self._lock:
+            self._closed = True
+            self._wake_waiters_locked()
+
+    def _wake_waiters_locked(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(self._notify, waiter)
+
+    @staticmethod
+    def _notify(waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def approx_bytes(self) -> int:
+        """Rough memory held by the buffered events (their JSON size)"""
+        with self._lock:
+            events = list(self._events)
+        return sum(len(json.dumps(event, default=str)) for event in events)
+
+    def events_after(self, last_id: int) -> List[Dict[str, Any]]:
+        """Buffered events newer than `last_id` (a gap marker first if some were dropped)"""
+        with self._lock:
+            events = [event for event in self._events if event["id"] > last_id]
+        if events and events[0]["id"] > last_id + 1:
+            gap = {"id": events[0]["id"] - 1, "type": "gap", "dropped": events[0]["id"] - last_id - 1}
+            events.insert(0, gap)
+        return events
+
+    async def subscribe(self, last_id: int = 0, heartbeat_s: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield events after `last_id` as they arrive, until the bus is closed.
+        Yields None every `heartbeat_s` seconds without events (for keep-alives).
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                has_new = self._next_id - 1 > last_id
+                closed = self._closed
+                if not has_new and not closed:
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+
+            if has_new:
+                for event in self.events_after(last_id):
+                    last_id = event["id"]
+                    yield event
+                continue
+            if closed:
+                return
+
+            try:
+                await asyncio.wait_for(waiter, timeout=heartbeat_s)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                yield None
+
+
+def emit(event_type: str, **data: Any) -> None:
+    """Publish to the running workflow's event bus, if it has one"""
+    workflow = get_current_workflow()
+    if workflow is not None and workflow.events is not None:
+        workflow.events.publish(event_type, **data)
+
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    """Server-Sent Events frame for an event (None becomes a keep-alive comment)"""
+    if event is None:
+        return ": keep-alive\n\n"
+    payload = json.dumps(event, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from factory import tool_parser
+from factory.tool_parser import ToolCommandParser
+from factory.tool_pool import ToolExecutionPool
+
+
+@pytest.fixture
+def parser():
+    # scan() never touches the executor, pool or idempotency store
+    return ToolCommandParser(object(), pool=object(), idempotency=object())
+
+
+def test_scan_finds_commands_in_order(parser):
+    output = (
+        "Done.\n"
+        "SEND_EMAIL: to=a@example.com | subject=Report | body=Line one\nline two\n"
+        "CREATE_EVENT: title=Review | date=2026-01-05 | time=10:00\n"
+        "POST_TWEET: text=Shipped"
+    )
+    commands = parser.scan(output)
+    assert [command.tool for command in commands] == ["send_email", "create_calendar_event", "post_tweet"]
+    assert commands[0].params == {"to": "a@example.com", "subject": "Report", "body": "Line one\nline two"}
+    assert commands[1].params == {"title": "Review", "date": "2026-01-05", "time": "10:00"}
+    assert commands[2].params == {"text": "Shipped"}
+
+
+def test_malformed_command_does_not_swallow_the_next_one(parser):
+    commands = parser.scan("SEND_EMAIL: to=a@example.com\nPOST_TWEET: text=hi")
+    assert [command.tool for command in commands] == ["post_tweet"]
+
+
+@pytest.mark.parametrize("fragment", [
+    "SEND_EMAIL: to=a",
+    "SEND_EMAIL: to=a\n",
+    "SEND_EMAIL: to=a|subject=b\n",
+    "CREATE_EVENT: title=a",
+    "CREATE_EVENT: title=a|date=b",
+])
+def test_scan_is_linear_on_repeated_malformed_commands(parser, fragment):
+    # Each failed match used to run to the end of the output: 4000 repeats took seconds
+    output = fragment * 20000
+    start = time.perf_counter()
+    commands = parser.scan(output)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.0, f"scan took {elapsed:.2f}s on {len(output)} chars"
+    assert all(command.tool == "send_email" for command in commands)
+
+
+class _RecordingLimiter:
+    """Stands in for the rate limiter and records what the tool pool looked like when budget was taken"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.in_flight = []
+        self.threads = []
+
+    def _record(self):
+        self.in_flight.append(self.pool.stats().get("post_tweet", {}).get("in_flight", 0))
+        self.threads.append(threading.current_thread())
+
+    async def acquire(self, provider, user_id=None, requests=1):
+        self._record()
+        await asyncio.sleep(0.01)
+
+    def acquire_blocking(self, provider, user_id=None, requests=1):
+        self._record()
+        time.sleep(0.01)
+
+
+class _AsyncTweets:
+    async def execute_tool_async(self, tool, params):
+        return f"posted {params['text']}"
+
+
+class _BlockingTweets:
+    def post_tweet(self, text):
+        return f"posted {text}"
+
+
+def test_async_budget_is_taken_before_the_pool_slot(monkeypatch):
+    pool = ToolExecutionPool(limits={"post_tweet": 1})
+    limiter = _RecordingLimiter(pool)
+    monkeypatch.setattr(tool_parser, "get_rate_limiter", lambda: limiter)
+    parser = ToolCommandParser(_AsyncTweets(), pool=pool, idempotency=object())
+
+    _, results = asyncio.run(parser.aparse_and_execute("POST_TWEET: text=a\nPOST_TWEET: text=b"))
+
+    assert results == ["posted a", "posted b"]
+    assert limiter.in_flight == [0, 0]
+
+
+def test_blocking_budget_is_taken_before_the_pool_thread(monkeypatch):
+    pool = ToolExecutionPool(limits={"post_tweet": 1})
+    limiter = _RecordingLimiter(pool)
+    monkeypatch.setattr(tool_parser, "get_rate_limiter", lambda: limiter)
+    parser = ToolCommandParser(_BlockingTweets(), pool=pool, idempotency=object())
+
+    _, results = parser.parse_and_execute("POST_TWEET: text=a\nPOST_TWEET: text=b")
+
+    assert results == ["posted a", "posted b"]
+    assert limiter.threads == [threading.current_thread()] * 2
+    pool.shutdown(wait=True)
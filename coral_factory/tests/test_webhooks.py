@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+
+import httpcore
+import pytest
+
+from factory import webhooks
+from factory.webhooks import WebhookDispatcher, check_callback_target, resolve_callback_host
+
+PUBLIC = "93.184.216.34"
+OK_RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"
+
+
+def _resolver(monkeypatch, *answers):
+    """Each lookup returns the next answer (the last one repeats); records the hosts looked up"""
+    lookups = []
+
+    async def resolve(host, port):
+        lookups.append(host)
+        return answers[min(len(lookups), len(answers)) - 1]
+
+    monkeypatch.setattr(webhooks, "_resolve", resolve)
+    return lookups
+
+
+class _RecordingBackend(httpcore.AsyncMockBackend):
+    """Answers every connection with OK_RESPONSE and records where it connected"""
+
+    def __init__(self):
+        super().__init__([OK_RESPONSE])
+        self.connected = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connected.append((host, port))
+        return await super().connect_tcp(host, port, timeout, local_address, socket_options)
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.0.0.5", "169.254.169.254", "100.64.0.1", "::1", "::ffff:127.0.0.1", "0.0.0.0"])
+def test_internal_addresses_are_refused(monkeypatch, address):
+    _resolver(monkeypatch, [address])
+    with pytest.raises(ValueError):
+        asyncio.run(check_callback_target("https://hooks.example.com/done", allow_private=False, allowed_hosts=frozenset()))
+
+
+def test_any_internal_address_refuses_the_host(monkeypatch):
+    _resolver(monkeypatch, [PUBLIC, "192.168.1.10"])
+    with pytest.raises(ValueError):
+        asyncio.run(resolve_callback_host("hooks.example.com", 443, False, frozenset()))
+
+
+def test_public_host_resolves_to_checked_addresses(monkeypatch):
+    _resolver(monkeypatch, [PUBLIC, "2606:2800:220:1::1"])
+    addresses = asyncio.run(resolve_callback_host("hooks.example.com", 443, False, frozenset()))
+    assert addresses == [PUBLIC, "2606:2800:220:1::1"]
+
+
+@pytest.mark.parametrize("allow_private, allowed_hosts", [(True, frozenset()), (False, frozenset({"receiver.internal"}))])
+def test_allowlisted_and_private_hosts_are_not_resolved(monkeypatch, allow_private, allowed_hosts):
+    lookups = _resolver(monkeypatch, ["127.0.0.1"])
+    addresses = asyncio.run(resolve_callback_host("Receiver.Internal", 80, allow_private, allowed_hosts))
+    assert addresses == ["receiver.internal"]
+    assert lookups == []
+
+
+def test_non_http_urls_are_refused():
+    with pytest.raises(ValueError):
+        asyncio.run(check_callback_target("file:///etc/passwd"))
+
+
+async def _deliver(dispatcher, url):
+    dispatcher.start()
+    dispatcher.enqueue(url, {"result": "done"}, "delivery-1")
+    await dispatcher.stop(timeout=2)
+
+
+def test_delivery_connects_to_the_checked_address(monkeypatch, tmp_path):
+    _resolver(monkeypatch, [PUBLIC])
+    backend = _RecordingBackend()
+    dispatcher = WebhookDispatcher(
+        max_concurrency=1, dead_letter_path=str(tmp_path / "dead.jsonl"),
+        allow_private=False, allowed_hosts=frozenset(), network_backend=backend,
+    )
+
+    asyncio.run(_deliver(dispatcher, "http://hooks.example.com/done"))
+
+    assert backend.connected == [(PUBLIC, 80)]
+    assert dispatcher.stats()["delivered"] == 1
+
+
+def test_dns_rebinding_after_the_check_is_refused(monkeypatch, tmp_path):
+    # Public when the request is validated, loopback by the time the delivery connects
+    lookups = _resolver(monkeypatch, [PUBLIC], ["127.0.0.1"])
+    backend = _RecordingBackend()
+    dead_letter = tmp_path / "dead.jsonl"
+    dispatcher = WebhookDispatcher(
+        max_concurrency=1, dead_letter_path=str(dead_letter),
+        allow_private=False, allowed_hosts=frozenset(), network_backend=backend,
+    )
+
+    async def scenario():
+        await dispatcher.check_url("http://hooks.example.com/done")
+        await _deliver(dispatcher, "http://hooks.example.com/done")
+
+    asyncio.run(scenario())
+
+    assert lookups == ["hooks.example.com", "hooks.example.com"]
+    assert backend.connected == []
+    assert dispatcher.stats()["delivered"] == 0
+    record = json.loads(dead_letter.read_text().splitlines()[0])
+    assert record["delivery_id"] == "delivery-1"
+    assert "internal address" in record["reason"]
+
+
+def test_unexpected_delivery_errors_are_dead_lettered(tmp_path):
+    # httpx.InvalidURL is neither an HTTPError nor an OSError
+    dead_letter = tmp_path / "dead.jsonl"
+    dispatcher = WebhookDispatcher(max_concurrency=1, dead_letter_path=str(dead_letter), allow_private=True)
+
+    asyncio.run(_deliver(dispatcher, "http://☃☃.com​/done"))
+
+    stats = dispatcher.stats()
+    assert (stats["attempts"], stats["retries"], stats["dead_lettered"]) == (1, 0, 1)
+    record = json.loads(dead_letter.read_text().splitlines()[0])
+    assert record["reason"].startswith("InvalidURL")
+
+
+def test_dead_letters_are_written_off_the_event_loop(tmp_path):
+    dispatcher = WebhookDispatcher(max_concurrency=1, queue_size=1, dead_letter_path=str(tmp_path / "dead.jsonl"))
+    threads = []
+    append = dispatcher._append_dead_letter
+
+    def recording_append(line):
+        threads.append(threading.current_thread())
+        append(line)
+
+    dispatcher._append_dead_letter = recording_append
+
+    async def scenario():
+        dispatcher.start()
+        for index in range(3):
+            # The queue holds one delivery; the others are dead-lettered straight away
+            dispatcher.enqueue("http://hooks.example.com/done", {"index": index}, f"delivery-{index}")
+        await dispatcher.stop(timeout=0)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+
+    assert len(threads) == 3
+    assert loop_thread not in threads
+    assert len((tmp_path / "dead.jsonl").read_text().splitlines()) == 3
@@ -122,15 +122,15 @@ export async function POST(req: NextRequest) {
     // Poll for the result
     const traceId = data?.trace_id;
     if (traceId) {
-      console.log("Deploy API - Polling for result...");
-      let pollCount = 0;
-      const maxPolls = 60; // 60 seconds max (increased for multi-agent workflows)
+      console.log("Deploy API - Waiting for result...");
+      const deadline = Date.now() + 60_000; // 60 seconds max (increased for multi-agent workflows)
       
-      while (pollCount < maxPolls) {
-        await new Promise((resolve) => setTimeout(resolve, 1000)); // Wait 1 second
+      while (Date.now() < deadline) {
+        // Long-poll: the factory holds the request until the workflow finishes or `wait` expires
+        const waitSeconds = Math.max(1, Math.min(25, Math.ceil((deadline - Date.now()) / 1000)));
         
         try {
-          const statusRes = await fetch(`${FACTORY_URL}/workflow/result/${traceId}`, {
+          const statusRes = await fetch(`${FACTORY_URL}/workflow/result/${traceId}?wait=${waitSeconds}`, {
             headers: {
               Authorization: `Bearer ${FACTORY_TOKEN}`,
             },
@@ -140,8 +140,7 @@ export async function POST(req: NextRequest) {
             const statusData = await statusRes.json();
             console.log("Deploy API - Poll response:", statusData);
             
-            if (statusData.status === "not_completed" || statusData.status === "not_found") {
-              pollCount++;
+            if (statusData.status === "not_completed") {
               continue;
             }
             
@@ -162,7 +161,8 @@ export async function POST(req: NextRequest) {
           console.error("Deploy API - Poll error:", pollErr);
         }
         
-        pollCount++;
+        // Unexpected answer or error: back off briefly before asking again
+        await new Promise((resolve) => setTimeout(resolve, 1000));
       }
       
       console.log("Deploy API - Timeout waiting for result");